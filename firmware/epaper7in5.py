@@ -29,19 +29,35 @@
 
 from machine import Pin, SPI
 import framebuf
+import micropython
 import utime
 
 # Display resolution
 EPD_WIDTH       = 800
 EPD_HEIGHT      = 480
+PLANE_CHUNK     = 4800      # plane bytes converted per SPI burst (48 rows)
+
+# Refresh modes carried in the CAN_SEND handshake
+MODE_4GRAY      = "FULL"
+MODE_FAST       = "FAST"
+MODE_PART       = "PART"
 
 RST_PIN         = 12
 DC_PIN          = 8
 CS_PIN          = 9
 BUSY_PIN        = 13
 
+# The decorator has to be written literally: the compiler emits native code
+# for @micropython.viper, there is no runtime micropython.viper to alias.
+@micropython.viper
+def _convert_4Gray(src: ptr8, dst: ptr8, count: int, lut: ptr8):
+    s = 0
+    for i in range(count):
+        dst[i] = (lut[src[s]] << 4) | lut[src[s + 1]]
+        s += 2
+
 class EPD_7in5:
-    def __init__(self):
+    def __init__(self, framebuffers=False):
         self.reset_pin = Pin(RST_PIN, Pin.OUT)
         
         self.busy_pin = Pin(BUSY_PIN, Pin.IN, Pin.PULL_UP)
@@ -57,14 +73,65 @@ class EPD_7in5:
         self.spi = SPI(1)
         self.spi.init(baudrate=4000_000)
         self.dc_pin = Pin(DC_PIN, Pin.OUT)
+        self.idle_us = 0
+        self.plane_buffer = bytearray(PLANE_CHUNK)
+        self.plane_13 = None
+        self.stream_pos = 0
+        self.stream_mode = None
+        self.stream_luts = None
+        # plane_13 holds the inverted black/white plane of the frame on the
+        # panel once a stream completed; MODE_PART sends it as old data.
+        self.plane_13_shown = False
+        self._build_4Gray_luts()
         
-        self.buffer_1Gray = bytearray(self.height * self.width // 8)
-        self.buffer_4Gray = bytearray(self.height * self.width // 4)
-        
-        self.image1Gray = framebuf.FrameBuffer(self.buffer_1Gray, self.width, self.height, framebuf.MONO_HLSB)
-        self.image4Gray = framebuf.FrameBuffer(self.buffer_4Gray, self.width, self.height, framebuf.GS2_HMSB)
+        # The 1-gray/4-gray framebuffers take 144 KB together; only allocate
+        # them for local drawing, streaming uploads never touch them.
+        self.buffer_1Gray = None
+        self.buffer_4Gray = None
+        self.image1Gray = None
+        self.image4Gray = None
+        if framebuffers:
+            self.buffer_1Gray = bytearray(self.height * self.width // 8)
+            self.buffer_4Gray = bytearray(self.height * self.width // 4)
+            
+            self.image1Gray = framebuf.FrameBuffer(self.buffer_1Gray, self.width, self.height, framebuf.MONO_HLSB)
+            self.image4Gray = framebuf.FrameBuffer(self.buffer_4Gray, self.width, self.height, framebuf.GS2_HMSB)
         self.init()
 
+    def _build_4Gray_luts(self):
+        # Panel-specific 2-bit level remap to correct grayscale order.
+        # Input levels: 0=black, 1=dark gray, 2=light gray, 3=white
+        # Remap fixes observed inversion/permutation on this panel.
+        # Each table maps an input byte (4 pixels, first pixel in the low
+        # bits) to a 4-bit nibble for plane 0x10 or 0x13, MSB first.
+        remap = (2, 0, 3, 1)
+        self.lut_4Gray_10 = bytearray(256)
+        self.lut_4Gray_13 = bytearray(256)
+        for value in range(256):
+            temp1 = value
+            nibble_10 = 0
+            nibble_13 = 0
+            for _ in range(4):
+                level = remap[temp1 & 0x03]
+                nibble_10 = (nibble_10 << 1) | (level >> 1)       # white, gray1
+                nibble_13 = (nibble_13 << 1) | (~level & 0x01)    # black, gray1
+                temp1 >>= 2
+            self.lut_4Gray_10[value] = nibble_10
+            self.lut_4Gray_13[value] = nibble_13
+
+        # Black/white modes (init_fast, init_part): levels 2-3 are white.
+        # Plane 0x10 takes the image, plane 0x13 its inverse, as in display().
+        self.lut_bw = bytearray(256)
+        self.lut_bw_inv = bytearray(256)
+        for value in range(256):
+            temp1 = value
+            nibble = 0
+            for _ in range(4):
+                nibble = (nibble << 1) | ((temp1 & 0x03) >> 1)
+                temp1 >>= 2
+            self.lut_bw[value] = nibble
+            self.lut_bw_inv[value] = ~nibble & 0x0F
+
     def digital_write(self, pin, value):
         pin.value(value)
 
@@ -107,12 +174,20 @@ class EPD_7in5:
         self.spi.write(bytearray(buf))
         self.digital_write(self.cs_pin, 1)
 
+    def send_burst(self, buf):
+        self.digital_write(self.dc_pin, 1)
+        self.digital_write(self.cs_pin, 0)
+        self.spi.write(buf)
+        self.digital_write(self.cs_pin, 1)
+
     def WaitUntilIdle(self):
         print("e-Paper busy")
+        start = utime.ticks_us()
         while(self.digital_read(self.busy_pin) == 0):    # Wait until the busy_pin goes LOW
             self.send_command(0x71)
             self.delay_ms(20)
         self.delay_ms(20) 
+        self.idle_us += utime.ticks_diff(utime.ticks_us(), start)
         print("e-Paper busy release")  
 
     def TurnOnDisplay(self):
@@ -351,81 +426,114 @@ class EPD_7in5:
         self.WaitUntilIdle()
 
     def display_4Gray(self, image):
-        # Panel-specific 2-bit level remap to correct grayscale order.
-        # Input levels: 0=black, 1=dark gray, 2=light gray, 3=white
-        # Remap fixes observed inversion/permutation on this panel.
-        remap = (2, 0, 3, 1)
-        self.send_command(0x10)
-        for i in range(0, 48000):     
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = remap[temp1&0x03]
-                    if(temp2 == 0x03):
-                        temp3 |= 0x01   # white
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x00   # black
-                    elif(temp2 == 0x02):
-                        temp3 |= 0x01   # gray1
-                    else:   # 0x01
-                        temp3 |= 0x00   # gray2
-                    temp3 <<= 1
-
-                    temp1 >>= 2
-                    temp2 = remap[temp1&0x03]
-                    if(temp2 == 0x03):   # white
-                        temp3 |= 0x01
-                    elif(temp2 == 0x00):   # black
-                        temp3 |= 0x00
-                    elif(temp2 == 0x02):
-                        temp3 |= 0x01   # gray1
-                    else:   # 0x01
-                        temp3 |= 0x00   # gray2
-                    
-                    if (( j!=1 ) | ( k!=1 )):
-                        temp3 <<= 1
-
-                    temp1 >>= 2
-            self.send_data(temp3)
-            
-        self.send_command(0x13)	       
-        for i in range(0, 48000):       
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = remap[temp1&0x03]
-                    if(temp2 == 0x03):
-                        temp3 |= 0x00   # white
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x01   # black
-                    elif(temp2 == 0x02):
-                        temp3 |= 0x01   # gray1
-                    else:   # 0x01
-                        temp3 |= 0x00   # gray2
-                    temp3 <<= 1
-
-                    temp1 >>= 2
-                    temp2 = remap[temp1&0x03]
-                    if(temp2 == 0x03):   # white
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x01   # black
-                    elif(temp2 == 0x02):
-                        temp3 |= 0x01   # gray1
-                    else:   # 0x01
-                        temp3 |= 0x00   # gray2
-                    
-                    if (( j!=1 ) | ( k!=1 )):
-                        temp3 <<= 1
-
-                    temp1 >>= 2
-            self.send_data(temp3)
+        # Each plane byte packs 8 pixels (two input bytes) via the lookup
+        # tables built in _build_4Gray_luts, converted in PLANE_CHUNK slices.
+        src = memoryview(image)
+        buf = self.plane_buffer
+        plane_size = self.height * self.width // 8
+        for command, lut in ((0x10, self.lut_4Gray_10), (0x13, self.lut_4Gray_13)):
+            self.send_command(command)
+            self.digital_write(self.dc_pin, 1)
+            self.digital_write(self.cs_pin, 0)
+            for start in range(0, plane_size, PLANE_CHUNK):
+                count = min(PLANE_CHUNK, plane_size - start)
+                _convert_4Gray(src[start * 2:], buf, count, lut)
+                if count == PLANE_CHUNK:
+                    self.spi.write(buf)
+                else:
+                    self.spi.write(memoryview(buf)[:count])
+            self.digital_write(self.cs_pin, 1)
+        
+        self.send_command(0x12)
+        self.delay_ms(100)
+        self.WaitUntilIdle()
+
+    # Streaming upload: the first plane goes straight to the controller as
+    # chunks arrive, plane 0x13 is kept in a 48 KB buffer until end_stream.
+    # lut_4Gray_13 and lut_bw_inv are the same table, so after any mode the
+    # buffer holds the inverted black/white image now on the panel.
+    # MODE_PART resets the controller, which loses its old-data RAM, so the
+    # buffer is written to 0x10 first; the new plane is then converted into
+    # the buffer in place and streamed to 0x13.
+    def alloc_stream(self):
+        if self.plane_13 is None:
+            self.plane_13 = bytearray(self.height * self.width // 8)
+
+    def begin_stream(self, mode=MODE_4GRAY):
+        # Returns the mode used: without a completed previous frame there is
+        # no old data for a partial refresh, and MODE_FAST is used instead.
+        self.alloc_stream()
+        if mode == MODE_PART and not self.plane_13_shown:
+            mode = MODE_FAST
+        self.plane_13_shown = False
+        self.stream_mode = mode
+        self.stream_pos = 0
+        if mode == MODE_4GRAY:
+            self.init_4Gray()
+            self.stream_luts = (self.lut_4Gray_10, self.lut_4Gray_13)
+            self.send_command(0x10)
+        elif mode == MODE_FAST:
+            self.init_fast()
+            self.stream_luts = (self.lut_bw, self.lut_bw_inv)
+            self.send_command(0x10)
+        elif mode == MODE_PART:
+            self.init_part()
+            self.stream_luts = (self.lut_bw_inv, None)
+            self.send_command(0x50)
+            self.send_data(0xA9)
+            self.send_data(0x07)
+
+            self.send_command(0x91)		#This command makes the display enter partial mode
+            self.send_command(0x90)		#resolution setting, full screen window
+            self.send_data(0x00)
+            self.send_data(0x00)
+            self.send_data((self.width - 1) // 256)
+            self.send_data((self.width - 1) % 256)
+            self.send_data(0x00)
+            self.send_data(0x00)
+            self.send_data((self.height - 1) // 256)
+            self.send_data((self.height - 1) % 256)
+            self.send_data(0x01)
+            self.send_command(0x10)
+            self.send_burst(self.plane_13)
+            self.send_command(0x13)
+        else:
+            raise ValueError("mode")
+        return mode
+
+    def stream_chunk(self, chunk):
+        if len(chunk) & 1:
+            raise ValueError("odd chunk")
+        src = memoryview(chunk)
+        plane_13 = memoryview(self.plane_13)
+        lut_first, lut_13 = self.stream_luts
+        buf = self.plane_buffer
+        total = len(chunk) // 2
+        if self.stream_pos + total > len(self.plane_13):
+            raise ValueError("overflow")
+        done = 0
+        while done < total:
+            count = min(PLANE_CHUNK, total - done)
+            if lut_13 is None:
+                target = plane_13[self.stream_pos:self.stream_pos + count]
+                _convert_4Gray(src[done * 2:], target, count, lut_first)
+                self.send_burst(target)
+            else:
+                _convert_4Gray(src[done * 2:], buf, count, lut_first)
+                _convert_4Gray(src[done * 2:], plane_13[self.stream_pos:], count, lut_13)
+                self.send_burst(buf if count == PLANE_CHUNK else memoryview(buf)[:count])
+            self.stream_pos += count
+            done += count
+
+    def end_stream(self):
+        if self.stream_luts[1] is not None:
+            self.send_command(0x13)
+            self.send_burst(self.plane_13)
         
         self.send_command(0x12)
         self.delay_ms(100)
         self.WaitUntilIdle()
+        self.plane_13_shown = self.stream_pos == len(self.plane_13)
 
 
     def sleep(self):
@@ -437,7 +545,7 @@ class EPD_7in5:
         self.send_data(0xa5)
 
 if __name__=='__main__':
-    epd = EPD_7in5()
+    epd = EPD_7in5(framebuffers=True)
     epd.Clear()
     
     epd.image1Gray.fill(0xFF)
@@ -4,24 +4,166 @@ import time
 import epaper7in5
 import gc
 import binascii
+import select
 
 gc.enable()
 led = machine.Pin(25, machine.Pin.OUT)
 TOTAL_SIZE = 96000
-CHUNK_HEX_SIZE = 1024 
+# Largest decoded chunk accepted per line, advertised in the YES reply as
+# max=. Bounds the readline and unhexlify buffers; hosts keep chunks even.
+MAX_CHUNK_SIZE = 2048
 SEND_QUERY = "CAN_SEND"
 SEND_OK = "YES"
 SEND_BUSY = "BUSY"
+# An upload that stalls longer than this is dropped; until then the host can
+# re-send CAN_SEND with the same id and continue from the reported offset.
+RESUME_TIMEOUT_MS = 60000
+REFRESH_MODES = (epaper7in5.MODE_4GRAY, epaper7in5.MODE_FAST, epaper7in5.MODE_PART)
+
+poller = select.poll()
+poller.register(sys.stdin, select.POLLIN)
+
+def _stats_line(stats):
+    return "STATS " + " ".join("{}={}".format(key, value) for key, value in stats)
+
+def _readline(timeout_ms):
+    if not poller.poll(timeout_ms):
+        return None
+    return sys.stdin.readline()
+
+def _parse_fields(tokens):
+    fields = {}
+    for token in tokens:
+        key, _, value = token.partition("=")
+        fields[key] = value
+    return fields
+
+class Upload:
+    def __init__(self, frame_id, crc, mode):
+        self.frame_id = frame_id
+        self.crc = crc
+        self.mode = mode
+        self.running_crc = 0
+        self.pos = 0
+        self.mem_start = gc.mem_free()
+        self.rx_us = 0
+        self.hex_us = 0
+        self.conv_us = 0
+        self.init_us = 0
+        self.chunks = 0
+
+def _start_upload(epd, fields):
+    crc = fields.get("crc")
+    mode = fields.get("mode", epaper7in5.MODE_4GRAY)
+    upload = Upload(fields.get("id"), int(crc, 16) if crc else None, mode)
+    led.value(1)
+    t0 = time.ticks_us()
+    upload.mode = epd.begin_stream(mode)
+    epd.idle_us = 0
+    upload.init_us = time.ticks_diff(time.ticks_us(), t0)
+    return upload
+
+def _abort_upload(epd):
+    led.value(0)
+    epd.sleep()
+    gc.collect()
+
+def _receive_chunk(epd, upload, line):
+    # Resumable uploads send "<offset> <crc32> <hex>"; a bare hex line is the
+    # original protocol without ids. Returns False when the upload is broken.
+    t0 = time.ticks_us()
+    offset = None
+    chunk_crc = None
+    if upload.frame_id is None:
+        hex_data = line
+    else:
+        parts = line.split()
+        if len(parts) != 3 or len(parts[2]) > 2 * MAX_CHUNK_SIZE:
+            print(f"NAK {upload.pos}")
+            return True
+        hex_data = parts[2]
+
+    # A garbled offset or checksum is NAKed like garbled hex.
+    try:
+        if upload.frame_id is not None:
+            offset = int(parts[0])
+            chunk_crc = int(parts[1], 16)
+        chunk_data = binascii.unhexlify(hex_data)
+    except Exception as e:
+        if upload.frame_id is None:
+            print(f"ERR:{e}")
+            return False
+        print(f"NAK {upload.pos}")
+        return True
+
+    if offset is not None and offset != upload.pos:
+        print(f"RESEND {upload.pos}")
+        return True
+
+    if chunk_crc is not None and binascii.crc32(chunk_data) != chunk_crc:
+        print(f"NAK {upload.pos}")
+        return True
+
+    length = len(chunk_data)
+    if upload.pos + length > TOTAL_SIZE:
+        print(f"ERR:OVERFLOW")
+        return False
+
+    t1 = time.ticks_us()
+    epd.stream_chunk(chunk_data)
+    t2 = time.ticks_us()
+    upload.running_crc = binascii.crc32(chunk_data, upload.running_crc)
+    upload.pos += length
+    upload.hex_us += time.ticks_diff(t1, t0)
+    upload.conv_us += time.ticks_diff(t2, t1)
+    upload.chunks += 1
+
+    if upload.frame_id is None:
+        print("OK")
+    else:
+        print(f"OK {upload.pos}")
+    return True
+
+def _finish_upload(epd, upload):
+    if upload.crc is not None and upload.running_crc != upload.crc:
+        print("ERR:HASH")
+        _abort_upload(epd)
+        return
+
+    try:
+        led.value(0)
+        idle_before = epd.idle_us
+        t1 = time.ticks_us()
+        epd.end_stream()
+        t2 = time.ticks_us()
+        idle_us = epd.idle_us - idle_before
+        epd.sleep()
+        t3 = time.ticks_us()
+        print("DONE")
+        print(_stats_line((
+            ("rx_us", upload.rx_us),
+            ("hex_us", upload.hex_us),
+            ("init_us", upload.init_us),
+            ("conv_us", upload.conv_us + time.ticks_diff(t2, t1) - idle_us),
+            ("idle_us", idle_us),
+            ("sleep_us", time.ticks_diff(t3, t2)),
+            ("chunks", upload.chunks),
+            ("mode", upload.mode),
+            ("mem_start", upload.mem_start),
+            ("mem_free", gc.mem_free()),
+        )))
+    except Exception as e:
+        print(f"ERR_DISP:{e}")
+    gc.collect()
 
 def main():
     epd = None
-    img_buffer = None
     
     try:
         epd = epaper7in5.EPD_7in5()
         
         try:
-            img_buffer = bytearray(TOTAL_SIZE)
+            epd.alloc_stream()
         except MemoryError:
             print("ERR_MEM")
             return
@@ -31,68 +173,60 @@ def main():
             time.sleep(0.1)
         led.value(0)
         time.sleep(2)
+        gc.collect()
         
+        upload = None
         while True:
-            gc.collect()
+            t0 = time.ticks_us()
+            line = _readline(RESUME_TIMEOUT_MS if upload else -1)
+            if upload:
+                upload.rx_us += time.ticks_diff(time.ticks_us(), t0)
             
-            while True:
-                line = sys.stdin.readline()
-                if not line:
-                    time.sleep(0.01)
-                    continue
-                
-                line = line.strip()
-                if line == SEND_QUERY:
-                    print(SEND_OK)
-                    break
+            if line is None:
+                if upload:
+                    _abort_upload(epd)
+                    upload = None
+                continue
             
-            current_byte_pos = 0
-            led.value(1)
-            mv = memoryview(img_buffer)
-
-            receive_error = False
-            while current_byte_pos < TOTAL_SIZE:
-                hex_line = sys.stdin.readline()
-                
-                if not hex_line:
-                    time.sleep(0.01)
+            line = line.strip()
+            if not line:
+                continue
+
+            if line.startswith(SEND_QUERY):
+                fields = _parse_fields(line.split()[1:])
+                if upload and upload.frame_id and upload.frame_id == fields.get("id"):
+                    print(f"{SEND_OK} off={upload.pos} max={MAX_CHUNK_SIZE}")
                     continue
-                    
-                hex_line = hex_line.strip()
-                if not hex_line:
+                if upload:
+                    _abort_upload(epd)
+                    upload = None
+                if fields.get("mode", epaper7in5.MODE_4GRAY) not in REFRESH_MODES:
+                    print("ERR:MODE")
                     continue
+                if "id" in fields:
+                    print(f"{SEND_OK} off=0 max={MAX_CHUNK_SIZE}")
+                else:
+                    print(SEND_OK)
+                upload = _start_upload(epd, fields)
+                continue
 
-                try:
-                    chunk_data = binascii.unhexlify(hex_line)
-                    length = len(chunk_data)
-                    
-                    if current_byte_pos + length > TOTAL_SIZE:
-                        print(f"ERR:OVERFLOW")
-                        receive_error = True
-                        break
-
-                    mv[current_byte_pos : current_byte_pos + length] = chunk_data
-                    current_byte_pos += length
-                    
-                    print("OK")
-                    
-                except Exception as e:
-                    print(f"ERR:{e}")
-                    receive_error = True
-                    break
-            
-            if receive_error:
-                led.value(0)
+            if upload is None:
                 continue
 
             try:
-                led.value(0)
-                epd.init_4Gray()
-                epd.display_4Gray(img_buffer)
-                epd.sleep()
-                print("DONE")
+                if not _receive_chunk(epd, upload, line):
+                    _abort_upload(epd)
+                    upload = None
+                    continue
             except Exception as e:
-                print(f"ERR_DISP:{e}")
+                print(f"ERR:{e}")
+                _abort_upload(epd)
+                upload = None
+                continue
+
+            if upload.pos >= TOTAL_SIZE:
+                _finish_upload(epd, upload)
+                upload = None
 
     except Exception as e:
         print(f"FATAL:{e}")
@@ -101,4 +235,4 @@ def main():
             time.sleep(0.5)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageDraw
+
+import calendar_api
+import dither
+import generate_image
+import send_image
+
+DEFAULT_SIZES = [0, 10, 100, 1000]
+STAGES = ["parse", "html", "render", "crop", "pack", "dither", "upload", "firmware"]
+FIRMWARE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "firmware")
+SIM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "firmware_sim")
+SUMMARIES = ["팀 회의", "점심 약속", "Code review", "운동", "Dentist", "스터디", "1:1", "Deploy"]
+WEATHER_LABEL = "하루 종일 맑음"
+
+def synthetic_items(count, now, seed=0):
+    rng = random.Random(seed)
+    items = []
+    for index in range(count):
+        day = now.date() + timedelta(days=rng.randrange(generate_image.DAYS_SHOWN))
+        summary = f"{rng.choice(SUMMARIES)} #{index}"
+        if rng.random() < 0.1:
+            items.append(
+                {
+                    "summary": summary,
+                    "start": {"date": day.isoformat()},
+                    "end": {"date": (day + timedelta(days=1)).isoformat()},
+                }
+            )
+            continue
+        start = datetime.combine(day, datetime.min.time(), tzinfo=now.tzinfo) + timedelta(
+            minutes=rng.randrange(7 * 60, 22 * 60, 15)
+        )
+        end = start + timedelta(minutes=rng.choice([15, 30, 60, 90, 120]))
+        items.append(
+            {
+                "summary": summary,
+                "start": {"dateTime": start.isoformat()},
+                "end": {"dateTime": end.isoformat()},
+            }
+        )
+    return items
+
+def _time_runs(func, repeat):
+    runs = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func()
+        runs.append(time.perf_counter() - start)
+    return runs, result
+
+def _record(stage, size, runs, **extra):
+    record = {
+        "stage": stage,
+        "events": size,
+        "runs": len(runs),
+        "min_s": min(runs),
+        "median_s": statistics.median(runs),
+        "max_s": max(runs),
+    }
+    record.update(extra)
+    return record
+
+def _skipped(stage, size, reason):
+    return {"stage": stage, "events": size, "status": "skipped", "reason": reason}
+
+def _placeholder_screenshot(path):
+    img = Image.new("RGB", (800, 601), "white")
+    draw = ImageDraw.Draw(img)
+    for x in range(0, 800, 40):
+        draw.line((x, 0, x, 600), fill="black")
+    for y in range(0, 601, 30):
+        draw.text((4, y), f"{y:03d}", fill="black")
+    img.save(path)
+
+def _run_firmware(frame_path, repeat, micropython):
+    interpreter = micropython or sys.executable
+    script = os.path.join(SIM_DIR, "bench_display.py")
+    output = subprocess.run(
+        [interpreter, script, FIRMWARE_DIR, frame_path, str(repeat)],
+        cwd=SIM_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    runs = [us / 1_000_000 for us in result["runs_us"]]
+    stream_runs = [us / 1_000_000 for us in result["stream_runs_us"]]
+    return runs, stream_runs, result["spi_bytes"]
+
+def run_size(size, stages, repeat, workdir, upload_url, micropython):
+    now = datetime.now().astimezone()
+    items = synthetic_items(size, now)
+    screenshot = os.path.join(workdir, f"bench_{size}.png")
+    image_path = os.path.join(workdir, f"bench_{size}.jpg")
+    frame_path = os.path.join(workdir, f"bench_{size}.bin")
+
+    runs, events = _time_runs(lambda: calendar_api.parse_events(items, now.tzinfo), repeat)
+    if "parse" in stages:
+        yield _record("parse", size, runs)
+
+    runs, html_content = _time_runs(
+        lambda: generate_image.build_html(events, now=now, weather_label=WEATHER_LABEL),
+        repeat,
+    )
+    if "html" in stages:
+        yield _record("html", size, runs, html_bytes=len(html_content.encode()))
+
+    rendered = False
+    if "render" in stages:
+        try:
+            runs, _ = _time_runs(lambda: generate_image.render_html(html_content, screenshot), repeat)
+            rendered = True
+            yield _record("render", size, runs)
+        except Exception as exc:
+            yield _skipped("render", size, str(exc))
+    if not rendered:
+        _placeholder_screenshot(screenshot)
+
+    def crop():
+        shutil.copyfile(screenshot, image_path)
+        generate_image.crop_screenshot(image_path)
+
+    runs, _ = _time_runs(crop, repeat)
+    if "crop" in stages:
+        yield _record("crop", size, runs, rendered=rendered)
+
+    runs, raw_data = _time_runs(lambda: send_image.process_image(image_path), repeat)
+    if "pack" in stages:
+        yield _record("pack", size, runs, bytes=len(raw_data))
+    with open(frame_path, "wb") as f:
+        f.write(raw_data)
+
+    if "dither" in stages:
+        baseline = statistics.median(runs)
+        for mode in dither.MODES:
+            mode_runs, _ = _time_runs(lambda: send_image.process_image(image_path, mode), repeat)
+            yield _record(
+                "dither",
+                size,
+                mode_runs,
+                mode=mode,
+                vs_threshold_s=statistics.median(mode_runs) - baseline,
+            )
+
+    if "upload" in stages:
+        # Every run starts from the default chunk size, and emulator links
+        # never end up in the per-port tuning file.
+        runs, sent = _time_runs(lambda: send_image.send_frame(raw_data, upload_url, tuning_path=None), repeat)
+        yield _record("upload", size, runs, link=upload_url, ok=bool(sent))
+
+    if "firmware" in stages:
+        try:
+            runs, stream_runs, spi_bytes = _run_firmware(frame_path, repeat, micropython)
+            interpreter = "micropython" if micropython else "cpython"
+            yield _record("firmware", size, runs, interpreter=interpreter, path="display_4Gray", spi_bytes=spi_bytes)
+            yield _record("firmware", size, stream_runs, interpreter=interpreter, path="stream_4Gray")
+        except (OSError, subprocess.CalledProcessError, ValueError) as exc:
+            yield _skipped("firmware", size, str(exc))
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each refresh pipeline stage.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--upload-url", default="loop://")
+    parser.add_argument("--micropython", help="path to a MicroPython unix port binary")
+    parser.add_argument("--output", help="append JSON lines here instead of stdout")
+    args = parser.parse_args()
+
+    out = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    header = {
+        "stage": "meta",
+        "timestamp": datetime.now().astimezone().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": args.repeat,
+    }
+    try:
+        print(json.dumps(header), file=out, flush=True)
+        with tempfile.TemporaryDirectory() as workdir:
+            for size in args.sizes:
+                for record in run_size(size, args.stages, args.repeat, workdir, args.upload_url, args.micropython):
+                    print(json.dumps(record, ensure_ascii=False), file=out, flush=True)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -37,66 +37,82 @@ def _parse_event_time(value):
         return datetime.datetime.fromisoformat(value)
     return datetime.date.fromisoformat(value)
 
-def fetch_events(days: int = 5):
-    creds = _get_credentials()
-    local_tz = datetime.datetime.now().astimezone().tzinfo
+def parse_events(items, local_tz=None):
+    if local_tz is None:
+        local_tz = datetime.datetime.now().astimezone().tzinfo
+
+    events = []
+    for event in items:
+        start_raw = event.get("start", {}).get("dateTime") or event.get("start", {}).get("date")
+        end_raw = event.get("end", {}).get("dateTime") or event.get("end", {}).get("date")
+        start_parsed = _parse_event_time(start_raw)
+        end_parsed = _parse_event_time(end_raw)
+
+        all_day = not isinstance(start_parsed, datetime.datetime)
+        if all_day:
+            start_dt = datetime.datetime.combine(start_parsed, datetime.time.min, tzinfo=local_tz)
+            if isinstance(end_parsed, datetime.date):
+                end_dt = datetime.datetime.combine(end_parsed, datetime.time.min, tzinfo=local_tz)
+            else:
+                end_dt = start_dt + datetime.timedelta(days=1)
+        else:
+            start_dt = start_parsed.astimezone(local_tz)
+            end_dt = end_parsed.astimezone(local_tz) if isinstance(end_parsed, datetime.datetime) else start_dt
+
+        events.append(
+            {
+                "summary": event.get("summary", "No title"),
+                "start": start_dt,
+                "end": end_dt,
+                "all_day": all_day,
+            }
+        )
+
+    events.sort(key=lambda item: item["start"])
+    return events
+
+class FetchError(Exception):
+    pass
 
+def fetch_items(calendar_ids, time_min, time_max):
+    # Raw API items per calendar. Unlike fetch_events, failures raise
+    # FetchError so callers can tell an outage from an empty calendar.
     try:
-        service = build("calendar", "v3", credentials=creds)
-
-        now = datetime.datetime.now().astimezone()
-        end_time = (now + datetime.timedelta(days=days)).isoformat()
-        start_time = now.isoformat()
-
-        print(f"[calendar API] search period: {start_time} ~ {end_time}")
-        print("-" * 50)
-
-        events_result = (
-            service.events()
-            .list(
-                calendarId="primary",
-                timeMin=start_time,
-                timeMax=end_time,
-                singleEvents=True,
-                orderBy="startTime",
-            )
-            .execute()
-        )
-        items = events_result.get("items", [])
-        events = []
-
-        for event in items:
-            start_raw = event.get("start", {}).get("dateTime") or event.get("start", {}).get("date")
-            end_raw = event.get("end", {}).get("dateTime") or event.get("end", {}).get("date")
-            start_parsed = _parse_event_time(start_raw)
-            end_parsed = _parse_event_time(end_raw)
-
-            all_day = not isinstance(start_parsed, datetime.datetime)
-            if all_day:
-                start_dt = datetime.datetime.combine(start_parsed, datetime.time.min, tzinfo=local_tz)
-                if isinstance(end_parsed, datetime.date):
-                    end_dt = datetime.datetime.combine(end_parsed, datetime.time.min, tzinfo=local_tz)
-                else:
-                    end_dt = start_dt + datetime.timedelta(days=1)
-            else:
-                start_dt = start_parsed.astimezone(local_tz)
-                end_dt = end_parsed.astimezone(local_tz) if isinstance(end_parsed, datetime.datetime) else start_dt
-
-            events.append(
-                {
-                    "summary": event.get("summary", "No title"),
-                    "start": start_dt,
-                    "end": end_dt,
-                    "all_day": all_day,
-                }
+        service = build("calendar", "v3", credentials=_get_credentials())
+        items = {}
+        for calendar_id in calendar_ids:
+            events_result = (
+                service.events()
+                .list(
+                    calendarId=calendar_id,
+                    timeMin=time_min.isoformat(),
+                    timeMax=time_max.isoformat(),
+                    singleEvents=True,
+                    orderBy="startTime",
+                )
+                .execute()
             )
+            items[calendar_id] = events_result.get("items", [])
+        return items
+    except Exception as error:
+        raise FetchError(str(error)) from error
 
-        events.sort(key=lambda item: item["start"])
-        return events
+def fetch_events(days: int = 5, calendar_ids=("primary",)):
+    local_tz = datetime.datetime.now().astimezone().tzinfo
+    now = datetime.datetime.now().astimezone()
+    end_time = now + datetime.timedelta(days=days)
+
+    print(f"[calendar API] search period: {now.isoformat()} ~ {end_time.isoformat()}")
+    print("-" * 50)
 
-    except HttpError as error:
+    try:
+        items = fetch_items(calendar_ids, now, end_time)
+    except FetchError as error:
+        if not isinstance(error.__cause__, HttpError):
+            raise
         print(f"[calendar API] Error: {error}")
         return []
+    return parse_events([item for calendar_id in calendar_ids for item in items[calendar_id]], local_tz)
 
 def main():
     events = fetch_events()
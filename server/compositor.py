@@ -0,0 +1,250 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import calendar_api
+import fonts
+import generate_image
+
+WIDTH = 800
+HEIGHT = 480
+RENDER_LAYERED = os.getenv("RENDER_LAYERED", "0") == "1"
+CHROME_CACHE_SIZE = 8
+# Changed regions are reported on this grid; partial refresh windows on the
+# panel are byte aligned horizontally, so keep TILE_WIDTH a multiple of 8.
+TILE_WIDTH = 40
+TILE_HEIGHT = 24
+
+# Geometry of index.html at 800x480, in pixels. The dynamic layers are drawn
+# natively at these positions on top of the browser-rendered chrome, so they
+# are only valid for the template they were measured from: any other layout,
+# or an edit to index.html, is rendered by the browser instead. Re-measure
+# and update LAYOUT_SHA1 after changing index.html.
+LAYOUT_SHA1 = "fb058cc0fee8ce8eb0595f28bf6ac270259424c8"
+HEADER_RIGHT = 264
+HEADER_MIDDLE = 24
+LIST_LEFT = 18
+LIST_RIGHT = 262
+LIST_TOP = 54
+LIST_BOTTOM = 464
+LIST_ROW = 46
+LIST_GAP = 12
+DAYS_LEFT = 334
+DAYS_RIGHT = 792
+BODY_TOP = 30
+BODY_HEIGHT = 441
+EVENT_INSET = 3
+
+class LayerCache:
+    def __init__(self, size=CHROME_CACHE_SIZE):
+        self.size = size
+        self._layers = OrderedDict()
+
+    def get(self, key, render):
+        layer = self._layers.get(key)
+        if layer is None:
+            layer = self._layers[key] = render()
+            while len(self._layers) > self.size:
+                self._layers.popitem(last=False)
+        else:
+            self._layers.move_to_end(key)
+        return layer
+
+def composite(layers):
+    # Black ink on white: the darkest layer wins at every pixel.
+    return np.minimum.reduce(layers)
+
+def changed_regions(previous, current, tile_width=TILE_WIDTH, tile_height=TILE_HEIGHT):
+    # Bounding boxes (x0, y0, x1, y1) of changed tiles, merged along rows.
+    if previous is None:
+        return [(0, 0, current.shape[1], current.shape[0])]
+    height, width = current.shape
+    rows = height // tile_height
+    cols = width // tile_width
+    changed = (previous != current).reshape(rows, tile_height, cols, tile_width).any(axis=(1, 3))
+    regions = []
+    for row in range(rows):
+        col = 0
+        while col < cols:
+            if not changed[row, col]:
+                col += 1
+                continue
+            start = col
+            while col < cols and changed[row, col]:
+                col += 1
+            regions.append((start * tile_width, row * tile_height, col * tile_width, (row + 1) * tile_height))
+    return regions
+
+def _fit(draw, text, font, width):
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text + "…"
+
+def _blank():
+    return Image.new("L", (WIDTH, HEIGHT), 255)
+
+def draw_header(weather_label):
+    img = _blank()
+    draw = ImageDraw.Draw(img)
+    font = fonts.pil_font(18)
+    draw.text((HEADER_RIGHT, HEADER_MIDDLE), weather_label, font=font, fill=0, anchor="rm")
+    return np.asarray(img)
+
+def draw_today_list(items):
+    img = _blank()
+    draw = ImageDraw.Draw(img)
+    font = fonts.pil_font(21)
+    y = LIST_TOP
+    for index, (time_label, summary) in enumerate(items):
+        if y + LIST_ROW > LIST_BOTTOM:
+            break
+        middle = y + LIST_ROW // 2
+        draw.text((LIST_LEFT, middle), time_label, font=font, fill=0, anchor="lm")
+        bar_x = LIST_LEFT + draw.textlength(time_label, font=font) + 8
+        draw.line((bar_x, y + 17, bar_x, y + LIST_ROW - 17), fill=0)
+        text_x = bar_x + LIST_GAP
+        draw.text((text_x, middle), _fit(draw, summary, font, LIST_RIGHT - text_x), font=font, fill=0, anchor="lm")
+        if index < len(items) - 1:
+            draw.line((LIST_LEFT - 2, y + LIST_ROW - 1, LIST_RIGHT + 2, y + LIST_ROW - 1), fill=0)
+        y += LIST_ROW
+    return np.asarray(img)
+
+def draw_events(columns):
+    img = _blank()
+    draw = ImageDraw.Draw(img)
+    font = fonts.pil_font(14)
+    column_width = (DAYS_RIGHT - DAYS_LEFT) / len(columns)
+    for index, segments in enumerate(columns):
+        left = round(DAYS_LEFT + index * column_width) + EVENT_INSET
+        right = round(DAYS_LEFT + (index + 1) * column_width) - 1 - EVENT_INSET
+        for top_pct, height_pct, segment_start, segment_end, summary in segments:
+            top = BODY_TOP + round(top_pct * BODY_HEIGHT / 100) + 1
+            bottom = top + max(1, round(height_pct * BODY_HEIGHT / 100)) - 1
+            draw.rounded_rectangle((left, top, right, bottom), radius=2, fill=0)
+            block = Image.new("L", (right - left - 8, max(1, bottom - top - 4)), 0)
+            block_draw = ImageDraw.Draw(block)
+            times = f"{segment_start:%H:%M}-{segment_end:%H:%M}"
+            block_draw.text((0, 0), _fit(block_draw, times, font, block.width), font=font, fill=255)
+            block_draw.text((0, 17), _fit(block_draw, summary, font, block.width), font=font, fill=255)
+            img.paste(block, (left + 4, top + 2))
+    return np.asarray(img)
+
+class LayoutError(ValueError):
+    pass
+
+def check_layout(template_path):
+    with open(template_path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    if digest != LAYOUT_SHA1:
+        raise LayoutError(f"{template_path} does not match the layered geometry (sha1 {digest[:12]})")
+
+class PageCompositor:
+    # Renders the calendar page as layers: the browser-rendered chrome is
+    # cached by (date, hour window); header, list and event blocks are
+    # redrawn natively on every render.
+    def __init__(self, template_path="index.html"):
+        check_layout(template_path)
+        self.template_path = template_path
+        self.chrome = LayerCache()
+        self._previous = {}
+
+    def _render_chrome(self, today, start_hour, end_hour, workdir):
+        html_content = fonts.inline_fonts(
+            generate_image.build_chrome_html(today, start_hour, end_hour, self.template_path)
+        )
+        filename = os.path.join(workdir, f"chrome_{today:%Y%m%d}_{start_hour}_{end_hour}.png")
+        generate_image.render_html(html_content, filename)
+        generate_image.crop_screenshot(filename)
+        with Image.open(filename) as img:
+            return np.asarray(img.convert("L"))
+
+    def render(self, events, now, weather_label, stale_label=None, workdir=".", key=None):
+        local_tz = now.tzinfo
+        today = now.date()
+        days = [today + timedelta(days=offset) for offset in range(generate_image.DAYS_SHOWN)]
+        start_hour, end_hour = generate_image.resolve_time_window(events, days)
+        if stale_label:
+            weather_label = f"{weather_label} · {stale_label}"
+
+        timings = {}
+        start = time.perf_counter()
+        chrome = self.chrome.get(
+            (today, start_hour, end_hour),
+            lambda: self._render_chrome(today, start_hour, end_hour, workdir),
+        )
+        timings["chrome_seconds"] = round(time.perf_counter() - start, 6)
+
+        start = time.perf_counter()
+        layers = [
+            chrome,
+            draw_header(weather_label),
+            draw_today_list(generate_image.today_items(events, today, local_tz)),
+            draw_events(generate_image.calendar_segments(events, days, local_tz, start_hour, end_hour)),
+        ]
+        frame = composite(layers)
+        timings["layers_seconds"] = round(time.perf_counter() - start, 6)
+        # Regions are relative to the previous render with the same key, so
+        # pre-rendered frames do not disturb those of the regular ones.
+        regions = changed_regions(self._previous.get(key), frame)
+        self._previous[key] = frame
+        return frame, timings, regions
+
+_COMPOSITORS = {}
+_REFUSED = set()
+
+def render_layered(
+    image_name="calendar.jpg",
+    events=None,
+    template_path="index.html",
+    now=None,
+    stale_label=None,
+):
+    # Returns (image_name, changed regions). The regions are relative to the
+    # last render into image_name, not to what any panel shows, so uploads
+    # diff against the panel themselves. Layouts the geometry does not fit
+    # are rendered by generate_image instead, with regions None.
+    if template_path not in _COMPOSITORS:
+        try:
+            _COMPOSITORS[template_path] = PageCompositor(template_path)
+        except LayoutError as exc:
+            if template_path not in _REFUSED:
+                print(f"[image generation] layered mode refused: {exc}")
+                _REFUSED.add(template_path)
+            image_name = generate_image.create_time_image(
+                image_name=image_name,
+                events=events,
+                template_path=template_path,
+                now=now,
+                stale_label=stale_label,
+            )
+            return image_name, None
+    if events is None:
+        events = calendar_api.fetch_events(days=generate_image.DAYS_SHOWN)
+    if now is None:
+        now = datetime.now().astimezone()
+    weather_label = generate_image.fetch_weather_label(now.date(), now.tzinfo)
+    frame, timings, regions = _COMPOSITORS[template_path].render(
+        events,
+        now,
+        weather_label,
+        stale_label,
+        workdir=os.path.dirname(image_name) or ".",
+        key=image_name,
+    )
+    Image.fromarray(frame, mode="L").save(image_name, quality=95)
+    print(
+        f"[image generation] layered: chrome {timings['chrome_seconds']:.3f}s, "
+        f"{len(regions)} changed regions, '{image_name}' saved."
+    )
+    return image_name, regions
+
+def create_layered_image(**kwargs):
+    # Drop-in for generate_image.create_time_image.
+    return render_layered(**kwargs)[0]
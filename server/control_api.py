@@ -0,0 +1,251 @@
+import asyncio
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import parse_qs, urlsplit
+
+import displays
+import frame_codec
+import metrics
+
+CONTROL_PORT = int(os.getenv("CONTROL_PORT", "9109"))
+# Requests wait this long for their job before answering 202 "queued".
+CONTROL_WAIT_SECONDS = float(os.getenv("CONTROL_WAIT_SECONDS", "180"))
+# Triggers closer together than this are merged into one render.
+DEBOUNCE_SECONDS = float(os.getenv("DEBOUNCE_SECONDS", "5"))
+DEBOUNCE_MAX_SECONDS = float(os.getenv("DEBOUNCE_MAX_SECONDS", "30"))
+MAX_BODY_BYTES = 8 * 1024 * 1024
+REASONS = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+class Job:
+    def __init__(self, kind, key, payload, created, due):
+        self.kind = kind
+        self.key = key
+        self.payload = payload
+        self.created = created
+        self.due = due
+        self.future = Future()
+
+class WorkQueue:
+    # Every render and upload goes through here and runs on the main loop.
+    # Submitting a job whose key is already pending merges into that job, so
+    # a burst of identical requests costs one render and one upload. A job
+    # only becomes ready after `debounce` seconds without another trigger,
+    # but never later than `max_delay` after the first one.
+    def __init__(self, debounce=DEBOUNCE_SECONDS, max_delay=DEBOUNCE_MAX_SECONDS):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._pending = OrderedDict()
+        self._ready = threading.Condition()
+
+    def submit(self, kind, payload=None, key=None, merge=None, debounce=None):
+        key = key or (kind,)
+        delay = self.debounce if debounce is None else debounce
+        now = time.monotonic()
+        with self._ready:
+            job = self._pending.get(key)
+            if job is None:
+                job = self._pending[key] = Job(kind, key, payload, now, now + delay)
+            else:
+                job.payload = payload if merge is None else merge(job.payload, payload)
+                job.due = max(job.due, min(now + delay, job.created + self.max_delay))
+            self._ready.notify()
+            return job.future
+
+    def pending(self, key):
+        with self._ready:
+            return self._pending.get(key)
+
+    def get(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._ready:
+            while True:
+                now = time.monotonic()
+                ready = [job for job in self._pending.values() if job.due <= now]
+                if ready:
+                    job = min(ready, key=lambda job: job.due)
+                    del self._pending[job.key]
+                    return job
+                if deadline is not None and now >= deadline:
+                    return None
+                wake = min((job.due for job in self._pending.values()), default=deadline)
+                if deadline is not None:
+                    wake = min(wake, deadline)
+                self._ready.wait(None if wake is None else wake - now)
+
+def merge_targets(current, new):
+    # None means "every display".
+    if current is None or new is None:
+        return None
+    return sorted(set(current) | set(new))
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _json_body(body):
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError as exc:
+        raise ApiError(400, f"invalid JSON: {exc}")
+    if not isinstance(request, dict):
+        raise ApiError(400, f"expected a JSON object, got {type(request).__name__}")
+    return request
+
+class ControlApi:
+    def __init__(self, work, runtime, wait_seconds=CONTROL_WAIT_SECONDS):
+        self.work = work
+        self.runtime = runtime
+        self.wait_seconds = wait_seconds
+
+    def _display(self, name):
+        for display in self.runtime.registry:
+            if display.name == name:
+                return display
+        raise ApiError(404, f"unknown display {name!r}")
+
+    async def _wait(self, future):
+        try:
+            result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.wait_seconds)
+        except asyncio.TimeoutError:
+            return 202, {"status": "queued"}
+        return 200, {"status": "done", "result": result}
+
+    async def refresh(self, query, body):
+        name = _json_body(body).get("display") or query.get("display")
+        targets = None if name is None else [self._display(name).name]
+        if self.runtime.sync is not None:
+            self.runtime.sync.request()
+        return await self._wait(self.work.submit("refresh", targets, merge=merge_targets))
+
+    async def push_image(self, query, body):
+        display = self._display(query.get("display") or self.runtime.registry[0].name)
+        if not body:
+            raise ApiError(400, "empty image")
+        payload = {"display": display.name, "image": body}
+        return await self._wait(self.work.submit("push", payload, key=("push", display.port)))
+
+    async def push_message(self, query, body):
+        request = _json_body(body)
+        display = self._display(request.get("display") or self.runtime.registry[0].name)
+        text = request.get("text")
+        if not text:
+            raise ApiError(400, "missing 'text'")
+        payload = {"display": display.name, "message": str(text)}
+        return await self._wait(self.work.submit("push", payload, key=("push", display.port)))
+
+    async def preview(self, query, body):
+        display = self._display(query.get("display") or self.runtime.registry[0].name)
+        levels = self.runtime.states[display.port].policy.previous
+        if levels is None:
+            raise ApiError(404, f"nothing sent to {display.name!r} yet")
+        buffer = io.BytesIO()
+        frame_codec.levels_to_image(levels).save(buffer, format="PNG")
+        return 200, buffer.getvalue()
+
+    async def last_metrics(self, query, body):
+        return 200, metrics.REGISTRY.last_cycle()
+
+    async def get_config(self, query, body):
+        return 200, {"displays": [display.to_dict() for display in self.runtime.registry]}
+
+    async def put_config(self, query, body):
+        try:
+            registry = displays.parse_config(_json_body(body), "request")
+        except (TypeError, ValueError) as exc:
+            raise ApiError(400, str(exc))
+        return await self._wait(self.work.submit("config", registry, debounce=0))
+
+    ROUTES = {
+        ("POST", "/refresh"): refresh,
+        ("POST", "/push/image"): push_image,
+        ("POST", "/push/message"): push_message,
+        ("GET", "/preview.png"): preview,
+        ("GET", "/metrics/last"): last_metrics,
+        ("GET", "/config"): get_config,
+        ("PUT", "/config"): put_config,
+    }
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        handler = self.ROUTES.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in self.ROUTES):
+                raise ApiError(405, f"{method} not allowed on {url.path}")
+            raise ApiError(404, f"no route {url.path}")
+        return await handler(self, query, body)
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1")
+            method, target, _ = request_line.split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length") or 0)
+            if length > MAX_BODY_BYTES:
+                raise ApiError(413, "request body too large")
+            body = await reader.readexactly(length) if length else b""
+            status, payload = await self.dispatch(method, target, body)
+        except ApiError as exc:
+            status, payload = exc.status, {"error": str(exc)}
+        except (ValueError, asyncio.IncompleteReadError) as exc:
+            status, payload = 400, {"error": str(exc) or "malformed request"}
+        except Exception as exc:
+            status, payload = 500, {"error": str(exc)}
+
+        if isinstance(payload, bytes):
+            content_type = "image/png"
+        else:
+            content_type = "application/json"
+            payload = json.dumps(payload, ensure_ascii=False, default=str).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n".encode()
+            + payload
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+def serve(work, runtime, port=CONTROL_PORT, host="127.0.0.1"):
+    if not port:
+        return None
+    api = ControlApi(work, runtime)
+    started = threading.Event()
+
+    async def run():
+        server = await asyncio.start_server(api.handle, host, port)
+        started.set()
+        async with server:
+            await server.serve_forever()
+
+    thread = threading.Thread(target=asyncio.run, args=(run(),), daemon=True)
+    thread.start()
+    started.wait(5)
+    if not thread.is_alive():
+        print(f"[control] could not listen on {host}:{port}")
+        return None
+    print(f"[control] serving http://{host}:{port}/")
+    return thread
@@ -0,0 +1,133 @@
+import json
+import os
+
+import dither
+import refresh_policy
+import send_image
+
+CONFIG_PATH = os.getenv("DISPLAY_CONFIG", "displays.json")
+DEFAULT_CALENDARS = ("primary",)
+DEFAULT_LAYOUT = "index.html"
+DEFAULT_DITHER = "threshold"
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 10 * 60
+
+class Display:
+    def __init__(
+        self,
+        name,
+        port,
+        calendars=DEFAULT_CALENDARS,
+        layout=DEFAULT_LAYOUT,
+        dither=DEFAULT_DITHER,
+        gamma=1.0,
+        tone_curve=None,
+    ):
+        self.name = name
+        self.port = port
+        self.calendars = tuple(calendars)
+        self.layout = layout
+        self.dither = dither
+        self.gamma = gamma
+        self.tone_curve = tuple(tuple(point) for point in tone_curve or ())
+
+    @property
+    def render_key(self):
+        return (self.calendars, self.layout)
+
+    @property
+    def quantize_key(self):
+        return (self.dither, self.gamma, self.tone_curve)
+
+    def calibration(self):
+        if self.gamma == 1.0 and not self.tone_curve:
+            return None
+        return dither.calibration_lut(self.gamma, self.tone_curve)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "port": self.port,
+            "calendars": list(self.calendars),
+            "layout": self.layout,
+            "dither": self.dither,
+            "gamma": self.gamma,
+            "tone_curve": [list(point) for point in self.tone_curve],
+        }
+
+    def __repr__(self):
+        return f"Display({self.name!r}, {self.port!r})"
+
+class DisplayState:
+    def __init__(self):
+        self.signature = None
+        self.date = None
+        self.failures = 0
+        self.retry_at = 0.0
+        self.policy = refresh_policy.RefreshPolicy()
+
+    def needs_update(self, signature, date):
+        return signature != self.signature or date != self.date
+
+    def can_retry(self, now):
+        return now >= self.retry_at
+
+    def mark_sent(self, signature, date):
+        self.signature = signature
+        self.date = date
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def mark_failed(self, now):
+        self.failures += 1
+        delay = min(RETRY_BASE_SECONDS * 2 ** (self.failures - 1), RETRY_MAX_SECONDS)
+        self.retry_at = now + delay
+
+def _parse_display(index, entry):
+    port = entry.get("port")
+    if not port:
+        raise ValueError(f"display #{index} has no 'port'")
+    calendars = entry.get("calendars") or DEFAULT_CALENDARS
+    if isinstance(calendars, str):
+        calendars = [calendars]
+    dither_mode = entry.get("dither", DEFAULT_DITHER)
+    if dither_mode not in dither.MODES:
+        raise ValueError(f"display #{index} has unknown dither mode {dither_mode!r}")
+    return Display(
+        name=entry.get("name", port),
+        port=port,
+        calendars=sorted(calendars),
+        layout=entry.get("layout", DEFAULT_LAYOUT),
+        dither=dither_mode,
+        gamma=float(entry.get("gamma", 1.0)),
+        tone_curve=entry.get("tone_curve"),
+    )
+
+def load_displays(path: str = CONFIG_PATH):
+    if not os.path.exists(path):
+        return [Display("default", send_image.PORT)]
+
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    return parse_config(config, path)
+
+def parse_config(config, source="config"):
+    displays = [
+        _parse_display(index, entry)
+        for index, entry in enumerate(config.get("displays", []))
+    ]
+    ports = [display.port for display in displays]
+    if len(set(ports)) != len(ports):
+        raise ValueError("each display needs its own port")
+    names = [display.name for display in displays]
+    if len(set(names)) != len(names):
+        raise ValueError("each display needs its own name")
+    if not displays:
+        raise ValueError(f"no displays configured in {source}")
+    return displays
+
+def group_by_render_key(displays):
+    groups = {}
+    for display in displays:
+        groups.setdefault(display.render_key, []).append(display)
+    return groups
@@ -0,0 +1,110 @@
+import numpy as np
+
+LEVEL_THRESHOLDS = [64, 128, 192]
+LEVEL_STEP = 255 / 3
+MODES = ("threshold", "text", "bayer", "floyd-steinberg")
+EDGE_THRESHOLD = 96
+
+BAYER_4 = np.array(
+    [
+        [0, 8, 2, 10],
+        [12, 4, 14, 6],
+        [3, 11, 1, 9],
+        [15, 7, 13, 5],
+    ],
+    dtype=np.float32,
+)
+
+def calibration_lut(gamma=1.0, points=None):
+    # Per-panel tone curve applied before quantizing. `points` is a list of
+    # [input, output] pairs that is linearly interpolated over 0..255.
+    values = np.arange(256, dtype=np.float32) / 255
+    values = values ** gamma * 255
+    if points:
+        inputs, outputs = zip(*sorted(points))
+        values = np.interp(values, inputs, outputs)
+    return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+
+THRESHOLD_LUT = np.digitize(np.arange(256), LEVEL_THRESHOLDS).astype(np.uint8)
+
+def threshold(pixels):
+    return THRESHOLD_LUT[pixels]
+
+def bayer(pixels):
+    height, width = pixels.shape
+    tiles = np.tile(BAYER_4, (height // 4 + 1, width // 4 + 1))[:height, :width]
+    scaled = pixels.astype(np.float32) / LEVEL_STEP
+    base = np.floor(scaled)
+    levels = base + ((scaled - base) * 16 > tiles + 0.5)
+    return np.clip(levels, 0, 3).astype(np.uint8)
+
+def _edge_mask(pixels):
+    signed = pixels.astype(np.int16)
+    gradient = np.zeros(pixels.shape, dtype=np.int16)
+    gradient[:, 1:] = np.abs(np.diff(signed, axis=1))
+    gradient[1:, :] = np.maximum(gradient[1:, :], np.abs(np.diff(signed, axis=0)))
+    edges = gradient > EDGE_THRESHOLD
+    grown = edges.copy()
+    grown[:, 1:] |= edges[:, :-1]
+    grown[:, :-1] |= edges[:, 1:]
+    grown[1:, :] |= edges[:-1, :]
+    grown[:-1, :] |= edges[1:, :]
+    return grown
+
+def text_preserving(pixels):
+    # Hard threshold around high-contrast edges (text, rules, event boxes)
+    # and ordered dithering for smooth areas such as photos and icons.
+    return np.where(_edge_mask(pixels), threshold(pixels), bayer(pixels))
+
+_wavefront_cache = {}
+
+def _wavefronts(height, width):
+    # Flat indices into the padded (height + 1, width + 2) work buffer, one
+    # array per anti-diagonal, cached per frame shape.
+    key = (height, width)
+    if key not in _wavefront_cache:
+        stride = width + 2
+        rows = np.arange(height)
+        fronts = []
+        for wavefront in range(width + 2 * (height - 1)):
+            xs = wavefront - 2 * rows
+            valid = (xs >= 0) & (xs < width)
+            fronts.append(rows[valid] * stride + xs[valid] + 1)
+        _wavefront_cache[key] = fronts
+    return _wavefront_cache[key]
+
+def floyd_steinberg(pixels):
+    # Exact Floyd-Steinberg, vectorized over anti-diagonal wavefronts: all
+    # pixels with the same x + 2y have every error contribution by then.
+    height, width = pixels.shape
+    stride = width + 2
+    work = np.zeros((height + 1, stride), dtype=np.float32)
+    work[:height, 1 : width + 1] = pixels
+    flat = work.ravel()
+    quantized = np.zeros_like(flat)
+
+    for index in _wavefronts(height, width):
+        old = flat[index]
+        level = np.clip(np.rint(old * (1 / LEVEL_STEP)), 0, 3)
+        quantized[index] = level
+        error = old - level * LEVEL_STEP
+        flat[index + 1] += error * (7 / 16)
+        flat[index + (stride - 1)] += error * (3 / 16)
+        flat[index + stride] += error * (5 / 16)
+        flat[index + (stride + 1)] += error * (1 / 16)
+
+    return quantized.reshape(height + 1, stride)[:height, 1 : width + 1].astype(np.uint8)
+
+_QUANTIZERS = {
+    "threshold": threshold,
+    "text": text_preserving,
+    "bayer": bayer,
+    "floyd-steinberg": floyd_steinberg,
+}
+
+def quantize(pixels, mode="threshold"):
+    try:
+        quantizer = _QUANTIZERS[mode]
+    except KeyError:
+        raise ValueError(f"unknown dither mode {mode!r}, expected one of {MODES}") from None
+    return quantizer(pixels)
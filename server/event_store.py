@@ -0,0 +1,202 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import calendar_api
+
+EVENT_STORE_PATH = os.getenv("EVENT_STORE", "events.sqlite3")
+SYNC_INTERVAL_SECONDS = int(os.getenv("SYNC_INTERVAL_SECONDS", str(5 * 60)))
+# Frames rendered from a cache older than this (or after a failed fetch)
+# carry an "as of" label.
+STALE_AFTER_SECONDS = int(os.getenv("STALE_AFTER_SECONDS", str(30 * 60)))
+SYNC_DAYS = 5
+KEEP_PAST_SECONDS = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    calendar_id TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    start_ts REAL NOT NULL,
+    end_ts REAL NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    all_day INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_range ON events (calendar_id, start_ts, end_ts);
+CREATE INDEX IF NOT EXISTS events_end ON events (end_ts);
+CREATE TABLE IF NOT EXISTS syncs (
+    calendar_id TEXT PRIMARY KEY,
+    synced_at REAL,
+    failed_at REAL,
+    error TEXT
+);
+"""
+
+def _row(event):
+    return (
+        event["summary"],
+        event["start"].timestamp(),
+        event["end"].timestamp(),
+        event["start"].isoformat(),
+        event["end"].isoformat(),
+        int(event["all_day"]),
+    )
+
+class SyncStatus:
+    def __init__(self, synced_at, failed_at, error, now=None):
+        self.synced_at = synced_at
+        self.failed_at = failed_at
+        self.error = error
+        self.checked_at = time.time() if now is None else now
+
+    @property
+    def stale(self):
+        if self.synced_at is None:
+            return True
+        if self.failed_at is not None and self.failed_at > self.synced_at:
+            return True
+        return self.checked_at - self.synced_at > STALE_AFTER_SECONDS
+
+    def label(self):
+        # Shown next to the weather when the frame may be out of date.
+        if not self.stale:
+            return None
+        if self.synced_at is None:
+            return "오프라인"
+        return datetime.fromtimestamp(self.synced_at).strftime("%m.%d %H:%M 기준")
+
+class EventStore:
+    def __init__(self, path=EVENT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def replace(self, calendar_id, window_start, window_end, events):
+        # Everything the API returned for the window replaces what the cache
+        # held for it. Returns whether the cached events actually changed.
+        start_ts = window_start.timestamp()
+        end_ts = window_end.timestamp()
+        rows = sorted(_row(event) for event in events)
+        with self._lock, self._db:
+            cached = sorted(
+                self._db.execute(
+                    "SELECT summary, start_ts, end_ts, start, end, all_day FROM events "
+                    "WHERE calendar_id = ? AND end_ts > ? AND start_ts < ?",
+                    (calendar_id, start_ts, end_ts),
+                )
+            )
+            self._db.execute(
+                "DELETE FROM events WHERE calendar_id = ? AND end_ts > ? AND start_ts < ?",
+                (calendar_id, start_ts, end_ts),
+            )
+            self._db.executemany(
+                "INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(calendar_id,) + row for row in rows],
+            )
+            self._db.execute("DELETE FROM events WHERE end_ts < ?", (start_ts - KEEP_PAST_SECONDS,))
+            self._db.execute(
+                "INSERT INTO syncs (calendar_id, synced_at) VALUES (?, ?) "
+                "ON CONFLICT(calendar_id) DO UPDATE SET synced_at = excluded.synced_at",
+                (calendar_id, time.time()),
+            )
+        return [tuple(row) for row in cached] != rows
+
+    def mark_failed(self, calendar_id, error):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO syncs (calendar_id, failed_at, error) VALUES (?, ?, ?) "
+                "ON CONFLICT(calendar_id) DO UPDATE SET failed_at = excluded.failed_at, error = excluded.error",
+                (calendar_id, time.time(), str(error)),
+            )
+
+    def events(self, calendar_ids, start, end):
+        placeholders = ",".join("?" * len(calendar_ids))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT summary, start, end, all_day FROM events "
+                f"WHERE calendar_id IN ({placeholders}) AND end_ts > ? AND start_ts < ? "
+                f"ORDER BY start_ts, rowid",
+                (*calendar_ids, start.timestamp(), end.timestamp()),
+            ).fetchall()
+        return [
+            {
+                "summary": summary,
+                "start": datetime.fromisoformat(start_iso),
+                "end": datetime.fromisoformat(end_iso),
+                "all_day": bool(all_day),
+            }
+            for summary, start_iso, end_iso, all_day in rows
+        ]
+
+    def status(self, calendar_ids):
+        # The oldest sync across the calendars decides how fresh a frame is.
+        placeholders = ",".join("?" * len(calendar_ids))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT synced_at, failed_at, error FROM syncs WHERE calendar_id IN ({placeholders})",
+                tuple(calendar_ids),
+            ).fetchall()
+        synced = [row[0] for row in rows]
+        synced_at = None if len(rows) < len(calendar_ids) or None in synced else min(synced)
+        failures = [
+            (failed_at, error)
+            for synced_at_row, failed_at, error in rows
+            if failed_at is not None and (synced_at_row is None or failed_at > synced_at_row)
+        ]
+        failed_at, error = max(failures) if failures else (None, None)
+        return SyncStatus(synced_at, failed_at, error)
+
+class EventSync:
+    # Pulls the calendars into the store in the background. Renders never
+    # wait on the network; on_change is called when the cache changed.
+    def __init__(self, store, calendar_sets, on_change=None, interval=SYNC_INTERVAL_SECONDS, days=SYNC_DAYS):
+        self.store = store
+        self.calendar_sets = list(calendar_sets)
+        self.on_change = on_change
+        self.interval = interval
+        self.days = days
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def sync(self, calendar_ids):
+        # Each calendar is fetched on its own, so one that fails (revoked
+        # share, deleted calendar) leaves the others fresh.
+        now = datetime.now().astimezone()
+        window_end = now + timedelta(days=self.days)
+        changed = False
+        with self._lock:
+            for calendar_id in calendar_ids:
+                try:
+                    items = calendar_api.fetch_items([calendar_id], now, window_end)[calendar_id]
+                except calendar_api.FetchError as error:
+                    print(f"[event store] Fetch of {calendar_id} failed, serving cached events: {error}")
+                    self.store.mark_failed(calendar_id, error)
+                    continue
+                events = calendar_api.parse_events(items, now.tzinfo)
+                changed |= self.store.replace(calendar_id, now, window_end, events)
+        return changed
+
+    def sync_all(self):
+        calendar_ids = sorted({calendar_id for calendars in self.calendar_sets for calendar_id in calendars})
+        changed = self.sync(calendar_ids) if calendar_ids else False
+        if changed and self.on_change is not None:
+            self.on_change()
+        return changed
+
+    def request(self):
+        self._wake.set()
+
+    def run(self):
+        while True:
+            try:
+                self.sync_all()
+            except Exception as exc:
+                print(f"[event store] Sync error: {exc}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
@@ -0,0 +1,79 @@
+# Times EPD_7in5.display_4Gray off-device. Runs under CPython or the
+# MicroPython unix port:
+#   micropython bench_display.py ../../firmware frame.bin 3
+import builtins
+import json
+import sys
+
+import sim_machine
+
+CHUNK_SIZE = 512
+
+def _install_shims():
+    sys.modules["machine"] = sim_machine
+    try:
+        import framebuf
+    except ImportError:
+        import sim_framebuf
+
+        sys.modules["framebuf"] = sim_framebuf
+    try:
+        import utime
+    except ImportError:
+        import sim_utime
+
+        sys.modules["utime"] = sim_utime
+    try:
+        import micropython
+    except ImportError:
+        import sim_micropython
+
+        sys.modules["micropython"] = sim_micropython
+        # Viper types are compiler builtins on the device; annotations are
+        # evaluated under CPython, so they have to resolve to something.
+        builtins.ptr8 = sim_micropython.ptr8
+        builtins.uint = sim_micropython.uint
+
+def _no_delay(delaytime):
+    pass
+
+def main():
+    firmware_dir = sys.argv[1]
+    frame_path = sys.argv[2]
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    _install_shims()
+    sys.path.insert(0, firmware_dir)
+    import epaper7in5
+    import utime
+
+    epd = epaper7in5.EPD_7in5()
+    epd.delay_ms = _no_delay
+    with open(frame_path, "rb") as f:
+        frame = f.read()
+
+    runs_us = []
+    for _ in range(repeat):
+        epd.spi.bytes_written = 0
+        start = utime.ticks_us()
+        epd.display_4Gray(frame)
+        runs_us.append(utime.ticks_diff(utime.ticks_us(), start))
+    spi_bytes = epd.spi.bytes_written
+
+    # Same frame through the streaming path in 512-byte upload chunks.
+    stream_runs_us = []
+    for _ in range(repeat):
+        start = utime.ticks_us()
+        epd.begin_stream()
+        for offset in range(0, len(frame), CHUNK_SIZE):
+            epd.stream_chunk(frame[offset : offset + CHUNK_SIZE])
+        epd.end_stream()
+        stream_runs_us.append(utime.ticks_diff(utime.ticks_us(), start))
+
+    print(json.dumps({
+        "runs_us": runs_us,
+        "stream_runs_us": stream_runs_us,
+        "spi_bytes": spi_bytes,
+    }))
+
+main()
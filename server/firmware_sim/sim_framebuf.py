@@ -0,0 +1,9 @@
+MONO_HLSB = 3
+GS2_HMSB = 5
+
+class FrameBuffer:
+    def __init__(self, buffer, width, height, fmt):
+        self.buffer = buffer
+        self.width = width
+        self.height = height
+        self.format = fmt
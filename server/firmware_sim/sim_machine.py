@@ -0,0 +1,29 @@
+# Host-side stand-ins for the RP2040 peripherals used by epaper7in5.py.
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 2
+
+    def __init__(self, pin_id, mode=None, pull=None):
+        self.pin_id = pin_id
+        self._value = 1
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = value
+
+    def toggle(self):
+        self._value ^= 1
+
+class SPI:
+    def __init__(self, bus_id):
+        self.bus_id = bus_id
+        self.bytes_written = 0
+
+    def init(self, baudrate=None):
+        self.baudrate = baudrate
+
+    def write(self, buf):
+        self.bytes_written += len(buf)
@@ -0,0 +1,8 @@
+# Host-side stand-in for the compiler-level micropython.viper decorator and
+# the viper pointer/integer types used in annotations.
+
+def viper(func):
+    return func
+
+ptr8 = None
+uint = None
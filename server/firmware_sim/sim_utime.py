@@ -0,0 +1,13 @@
+import time
+
+def sleep(seconds):
+    time.sleep(seconds)
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+def ticks_us():
+    return time.perf_counter_ns() // 1000
+
+def ticks_diff(end, start):
+    return end - start
@@ -0,0 +1,137 @@
+import base64
+import hashlib
+import os
+import re
+import string
+from functools import lru_cache
+
+from PIL import ImageFont
+
+try:
+    from fontTools import subset as ft_subset
+except ImportError:
+    ft_subset = None
+
+FONT_PATH = os.getenv("FONT_PATH")
+FONT_CACHE_DIR = os.getenv("FONT_CACHE_DIR", ".font_cache")
+# Subset files kept in FONT_CACHE_DIR; the least recently used go first.
+FONT_CACHE_FILES = int(os.getenv("FONT_CACHE_FILES", "64"))
+FONT_FAMILY = "EInkText"
+# Common install locations of a Hangul-capable font, checked in order.
+FONT_CANDIDATES = (
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/nanum/NanumGothic.ttf",
+    "/usr/share/fonts/nanum/NanumGothic.ttf",
+    "/Library/Fonts/AppleSDGothicNeo.ttc",
+    "/System/Library/Fonts/AppleSDGothicNeo.ttc",
+    "C:/Windows/Fonts/malgun.ttf",
+)
+# Always part of a subset so small label changes reuse the cached file.
+BASE_GLYPHS = frozenset(string.printable.strip() + " ·")
+_TAG = re.compile(r"<[^>]*>")
+
+@lru_cache(maxsize=None)
+def find_font():
+    for path in (FONT_PATH,) + FONT_CANDIDATES:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+def glyphs_in(html_content):
+    return BASE_GLYPHS | frozenset(_TAG.sub("", html_content)) - frozenset("\r\n\t")
+
+def _subset_path(font_path, glyphs):
+    stat = os.stat(font_path)
+    key = hashlib.sha1(
+        f"{font_path}:{stat.st_mtime_ns}:{stat.st_size}:".encode() + "".join(sorted(glyphs)).encode()
+    ).hexdigest()[:16]
+    return os.path.join(FONT_CACHE_DIR, f"{key}.ttf")
+
+def _prune_cache(keep=FONT_CACHE_FILES):
+    # Every new event summary makes a new glyph set, so without a cap the
+    # cache grows by one subset per calendar edit.
+    entries = []
+    for entry in os.scandir(FONT_CACHE_DIR):
+        if entry.name.endswith(".ttf"):
+            try:
+                entries.append((entry.stat().st_mtime_ns, entry.path))
+            except OSError:
+                pass
+    entries.sort(reverse=True)
+    for _, path in entries[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def subset_font(font_path, glyphs):
+    # Cached on disk by glyph set. Without fontTools the full font is used.
+    if ft_subset is None:
+        return font_path
+    path = _subset_path(font_path, glyphs)
+    if os.path.exists(path):
+        # Mark as recently used so pruning keeps it.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    else:
+        options = ft_subset.Options()
+        options.font_number = 0
+        font = ft_subset.load_font(font_path, options)
+        subsetter = ft_subset.Subsetter(options)
+        subsetter.populate(unicodes=[ord(char) for char in glyphs])
+        subsetter.subset(font)
+        os.makedirs(FONT_CACHE_DIR, exist_ok=True)
+        ft_subset.save_font(font, path + ".tmp", options)
+        os.replace(path + ".tmp", path)
+        _prune_cache()
+    return path
+
+@lru_cache(maxsize=32)
+def font_face_css(glyphs):
+    font_path = find_font()
+    if font_path is None:
+        return ""
+    path = subset_font(font_path, glyphs)
+    if path == font_path:
+        # A full CJK font is too large to inline on every render.
+        src = f"url('file://{os.path.abspath(path)}')"
+    else:
+        with open(path, "rb") as f:
+            src = f"url(data:font/ttf;base64,{base64.b64encode(f.read()).decode()}) format('truetype')"
+    return (
+        "<style>"
+        f"@font-face {{ font-family: '{FONT_FAMILY}'; src: {src}; font-display: block; }}"
+        f"body {{ font-family: 'Arial', '{FONT_FAMILY}', sans-serif; }}"
+        "</style>"
+    )
+
+def inline_fonts(html_content):
+    css = font_face_css(glyphs_in(html_content))
+    if not css:
+        return html_content
+    return html_content.replace("</head>", css + "</head>", 1)
+
+@lru_cache(maxsize=None)
+def pil_font(size):
+    # Native drawing path; loaded once per size.
+    font_path = find_font()
+    if font_path is not None:
+        return ImageFont.truetype(font_path, size)
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+def preload(sizes=(40,)):
+    font_path = find_font()
+    if font_path is None:
+        print("[fonts] no Hangul font found; set FONT_PATH")
+        return None
+    for size in sizes:
+        pil_font(size)
+    print(f"[fonts] using {font_path}" + ("" if ft_subset else " (fontTools missing, no subsetting)"))
+    return font_path
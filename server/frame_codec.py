@@ -0,0 +1,78 @@
+import argparse
+import sys
+
+import numpy as np
+from PIL import Image
+
+WIDTH = 800
+HEIGHT = 480
+FRAME_SIZE = WIDTH * HEIGHT // 4
+LEVEL_GRAYS = np.array([0, 85, 170, 255], dtype=np.uint8)
+# Same remap as EPD_7in5.display_4Gray: input level -> panel level.
+FIRMWARE_REMAP = np.array([2, 0, 3, 1], dtype=np.uint8)
+
+# Each frame byte holds four 2-bit levels, first pixel in the lowest bits:
+# byte = p0 | p1 << 2 | p2 << 4 | p3 << 6 (byte orientation (3,2,1,0)).
+# Unpacking goes through a 256-entry table; packing does not use a table,
+# it folds each group of four levels with shifts on a uint32 view.
+UNPACK_LUT = np.array(
+    [[(value >> shift) & 0x03 for shift in (0, 2, 4, 6)] for value in range(256)],
+    dtype=np.uint8,
+)
+
+def pack_levels(levels):
+    # Not a lookup table: four uint8 levels are viewed as one little-endian
+    # uint32 word, and shifting the word folds bytes 1-3 down next to byte 0,
+    # so there are no int64 temporaries.
+    flat = np.ascontiguousarray(levels, dtype=np.uint8).reshape(-1)
+    if flat.size % 4:
+        raise ValueError(f"level count {flat.size} is not a multiple of 4")
+    words = flat.view("<u4")
+    packed = words | (words >> 6) | (words >> 12) | (words >> 18)
+    return packed.astype(np.uint8).tobytes()
+
+def unpack_levels(frame, width=WIDTH, height=HEIGHT):
+    data = np.frombuffer(frame, dtype=np.uint8)
+    if data.size * 4 != width * height:
+        raise ValueError(f"frame has {data.size} bytes, expected {width * height // 4}")
+    return UNPACK_LUT[data].reshape(height, width)
+
+def firmware_planes(frame):
+    # Vectorized equivalent of the bit loops in display_4Gray: one bit per
+    # pixel, MSB first, for the 0x10 (old data) and 0x13 (new data) planes.
+    panel = FIRMWARE_REMAP[UNPACK_LUT[np.frombuffer(frame, dtype=np.uint8)].reshape(-1)]
+    plane_10 = np.packbits(panel >> 1)
+    plane_13 = np.packbits((panel & 0x01) ^ 0x01)
+    return plane_10.tobytes(), plane_13.tobytes()
+
+def planes_to_levels(plane_10, plane_13, width=WIDTH, height=HEIGHT):
+    bit_10 = np.unpackbits(np.frombuffer(plane_10, dtype=np.uint8))
+    bit_13 = np.unpackbits(np.frombuffer(plane_13, dtype=np.uint8))
+    panel = (bit_10 << 1) | (bit_13 ^ 0x01)
+    inverse = np.argsort(FIRMWARE_REMAP).astype(np.uint8)
+    return inverse[panel].reshape(height, width)
+
+def levels_to_image(levels):
+    return Image.fromarray(LEVEL_GRAYS[levels], mode="L")
+
+def frame_to_png(frame, path, via_firmware=False):
+    if via_firmware:
+        levels = planes_to_levels(*firmware_planes(frame))
+    else:
+        levels = unpack_levels(frame)
+    levels_to_image(levels).save(path, format="PNG")
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Preview packed 2-bpp frames.")
+    parser.add_argument("frame", help="raw 96000-byte frame file")
+    parser.add_argument("png", nargs="?", default="preview.png")
+    parser.add_argument("--via-firmware", action="store_true", help="decode through the firmware planes")
+    args = parser.parse_args()
+
+    with open(args.frame, "rb") as f:
+        frame = f.read()
+    print(f"[frame codec] preview saved: {frame_to_png(frame, args.png, args.via_firmware)}")
+
+if __name__ == "__main__":
+    sys.exit(main())
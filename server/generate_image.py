@@ -6,10 +6,12 @@ from urllib.parse import quote
 from urllib.request import urlopen
 from zoneinfo import ZoneInfo
 from html2image import Html2Image
-from PIL import Image
+from PIL import Image, ImageDraw
 import calendar_api
+import fonts
 
 WEEKDAY_KR = ["월", "화", "수", "목", "금", "토", "일"]
+DAYS_SHOWN = 3
 
 def _weekday_label(date_value):
     return WEEKDAY_KR[date_value.weekday()]
@@ -20,7 +22,7 @@ def _format_today_label(date_value):
 def _format_day_label(date_value):
     return date_value.strftime("%m.%d") + f"({_weekday_label(date_value)})"
 
-def _build_today_events_list(events, day_date, local_tz):
+def today_items(events, day_date, local_tz):
     day_start = datetime.combine(day_date, time.min, tzinfo=local_tz)
     day_end = day_start + timedelta(days=1)
     items = []
@@ -32,19 +34,18 @@ def _build_today_events_list(events, day_date, local_tz):
             time_label = "하루종일"
         else:
             time_label = event["start"].strftime("%H:%M")
-        summary = html.escape(event["summary"])
-        items.append(
-            f'<li><span class="event-time">{time_label}</span>'
-            f'<span class="event-text">{summary}</span></li>'
-        )
+        items.append((time_label, event["summary"]))
 
     if not items:
-        items.append(
-            '<li><span class="event-time">-</span>'
-            '<span class="event-text">일정 없음</span></li>'
-        )
+        items.append(("-", "일정 없음"))
+    return items
 
-    return "\n".join(items)
+def _build_today_events_list(events, day_date, local_tz):
+    return "\n".join(
+        f'<li><span class="event-time">{time_label}</span>'
+        f'<span class="event-text">{html.escape(summary)}</span></li>'
+        for time_label, summary in today_items(events, day_date, local_tz)
+    )
 
 def _build_calendar_headers(days):
     return "\n".join(
@@ -52,7 +53,8 @@ def _build_calendar_headers(days):
         for day in days
     )
 
-def _build_calendar_columns(events, days, local_tz, start_hour, end_hour):
+def calendar_segments(events, days, local_tz, start_hour, end_hour):
+    # Per day: (top_pct, height_pct, segment_start, segment_end, summary).
     columns = []
     for day in days:
         day_start = datetime.combine(day, time(hour=start_hour), tzinfo=local_tz)
@@ -61,7 +63,7 @@ def _build_calendar_columns(events, days, local_tz, start_hour, end_hour):
         else:
             day_end = datetime.combine(day, time(hour=end_hour), tzinfo=local_tz)
         total_minutes = (day_end - day_start).total_seconds() / 60
-        day_items = []
+        segments = []
 
         for event in events:
             if event["all_day"]:
@@ -77,11 +79,20 @@ def _build_calendar_columns(events, days, local_tz, start_hour, end_hour):
             duration_minutes = (segment_end - segment_start).total_seconds() / 60
             top_pct = max(0.0, min(100.0, offset_minutes / total_minutes * 100))
             height_pct = max(0.5, min(100.0 - top_pct, duration_minutes / total_minutes * 100))
+            segments.append((top_pct, height_pct, segment_start, segment_end, event["summary"]))
+
+        columns.append(segments)
+    return columns
 
+def _build_calendar_columns(events, days, local_tz, start_hour, end_hour):
+    columns = []
+    for segments in calendar_segments(events, days, local_tz, start_hour, end_hour):
+        day_items = []
+        for top_pct, height_pct, segment_start, segment_end, summary in segments:
             label = (
                 f"{segment_start.strftime('%H:%M')}-"
                 f"{segment_end.strftime('%H:%M')} <br> "
-                f"{html.escape(event['summary'])}"
+                f"{html.escape(summary)}"
             )
             day_items.append(
                 f'<div class="calendar-event" style="top: {top_pct:.3f}%; '
@@ -96,7 +107,7 @@ def _build_calendar_columns(events, days, local_tz, start_hour, end_hour):
 
     return "\n".join(columns)
 
-def _resolve_time_window(events, days, default_start=10, default_end=23):
+def resolve_time_window(events, days, default_start=10, default_end=23):
     if not events or not days:
         return default_start, default_end
 
@@ -138,7 +149,7 @@ def _build_calendar_time_labels(start_hour, end_hour):
         )
     return "\n".join(labels)
 
-def _fetch_weather_label(day_date, local_tz):
+def fetch_weather_label(day_date, local_tz):
     lat = float(os.getenv("WEATHER_LAT", "37.5665"))
     lon = float(os.getenv("WEATHER_LON", "126.9780"))
     tz_name = os.getenv("WEATHER_TZ", "Asia/Seoul")
@@ -181,39 +192,62 @@ def _fetch_weather_label(day_date, local_tz):
 
     return "하루 종일 맑음"
 
-def create_time_image(image_name: str = "calendar.jpg") -> str:
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    local_tz = datetime.now().astimezone().tzinfo
-    today = datetime.now().date()
-    days = [today + timedelta(days=offset) for offset in range(3)]
-    events = calendar_api.fetch_events(days=len(days))
-    weather_label = _fetch_weather_label(today, local_tz)
-    start_hour, end_hour = _resolve_time_window(events, days)
-
-    template_path = "index.html"
-    
+def _fill_template(template_path, fields):
     with open(template_path, "r", encoding="utf-8") as f:
         html_content = f.read()
-    
-    html_content = html_content.replace("{{time_placeholder}}", now)
-    html_content = html_content.replace("{{today_label}}", _format_today_label(today))
-    html_content = html_content.replace("{{weather_label}}", weather_label)
-    html_content = html_content.replace(
-        "{{today_events_list}}",
-        _build_today_events_list(events, today, local_tz),
+    for name, value in fields.items():
+        html_content = html_content.replace("{{" + name + "}}", value)
+    return html_content
+
+def build_html(
+    events,
+    now=None,
+    weather_label=None,
+    template_path: str = "index.html",
+    stale_label=None,
+) -> str:
+    if now is None:
+        now = datetime.now().astimezone()
+    local_tz = now.tzinfo
+    today = now.date()
+    days = [today + timedelta(days=offset) for offset in range(DAYS_SHOWN)]
+    if weather_label is None:
+        weather_label = fetch_weather_label(today, local_tz)
+    if stale_label:
+        weather_label = f"{weather_label} · {stale_label}"
+    start_hour, end_hour = resolve_time_window(events, days)
+
+    return _fill_template(
+        template_path,
+        {
+            "time_placeholder": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "today_label": _format_today_label(today),
+            "weather_label": weather_label,
+            "today_events_list": _build_today_events_list(events, today, local_tz),
+            "calendar_header_days": _build_calendar_headers(days),
+            "calendar_day_columns": _build_calendar_columns(events, days, local_tz, start_hour, end_hour),
+            "calendar_time_labels": _build_calendar_time_labels(start_hour, end_hour),
+        },
     )
-    html_content = html_content.replace("{{calendar_header_days}}", _build_calendar_headers(days))
-    html_content = html_content.replace(
-        "{{calendar_day_columns}}",
-        _build_calendar_columns(events, days, local_tz, start_hour, end_hour),
-    )
-    html_content = html_content.replace(
-        "{{calendar_time_labels}}",
-        _build_calendar_time_labels(start_hour, end_hour),
+
+def build_chrome_html(today, start_hour, end_hour, template_path: str = "index.html") -> str:
+    # The page without anything that depends on events or weather: labels,
+    # grid and empty day columns. Used as the cached static layer.
+    days = [today + timedelta(days=offset) for offset in range(DAYS_SHOWN)]
+    return _fill_template(
+        template_path,
+        {
+            "time_placeholder": "",
+            "today_label": _format_today_label(today),
+            "weather_label": "",
+            "today_events_list": "",
+            "calendar_header_days": _build_calendar_headers(days),
+            "calendar_day_columns": _build_calendar_columns([], days, None, start_hour, end_hour),
+            "calendar_time_labels": _build_calendar_time_labels(start_hour, end_hour),
+        },
     )
 
-    filename = image_name
-    
+def render_html(html_content, filename):
     flags = [
         '--window-size=800,601', 
         '--hide-scrollbars',
@@ -221,18 +255,62 @@ def create_time_image(image_name: str = "calendar.jpg") -> str:
         '--headless'
     ]
     
-    hti = Html2Image(custom_flags=flags)
+    hti = Html2Image(custom_flags=flags, output_path=os.path.dirname(filename) or ".")
     
     print(f"[image generation] image rendering...")
     
-    hti.screenshot(html_str=html_content, save_as=filename)
+    hti.screenshot(html_str=html_content, save_as=os.path.basename(filename))
 
+def crop_screenshot(filename):
     print("[image generation] cropping image...")
     
     with Image.open(filename) as img:
         cropped_img = img.crop((0, 0, 800, 480))
         cropped_img.save(filename, quality=95)
 
+def _wrap_text(draw, text, font, width):
+    lines = []
+    for paragraph in text.splitlines() or [""]:
+        line = ""
+        for char in paragraph:
+            if line and draw.textlength(line + char, font=font) > width:
+                lines.append(line)
+                line = char.lstrip()
+            else:
+                line += char
+        lines.append(line)
+    return lines
+
+def render_message(text, filename, font_size=40):
+    # Native drawing path for ad-hoc messages; no browser involved.
+    font = fonts.pil_font(font_size)
+    img = Image.new("L", (800, 480), 255)
+    draw = ImageDraw.Draw(img)
+    lines = _wrap_text(draw, text, font, 800 - 80)
+    line_height = int(font_size * 1.3)
+    y = max(20, (480 - line_height * len(lines)) // 2)
+    for line in lines:
+        x = (800 - draw.textlength(line, font=font)) / 2
+        draw.text((x, y), line, font=font, fill=0)
+        y += line_height
+    img.save(filename)
+    return filename
+
+def create_time_image(
+    image_name: str = "calendar.jpg",
+    events=None,
+    template_path: str = "index.html",
+    now=None,
+    stale_label=None,
+) -> str:
+    if events is None:
+        events = calendar_api.fetch_events(days=DAYS_SHOWN)
+    html_content = build_html(events, now=now, template_path=template_path, stale_label=stale_label)
+
+    filename = image_name
+    render_html(fonts.inline_fonts(html_content), filename)
+    crop_screenshot(filename)
+
     print(f"[image generation] success: '{filename}' saved.")
 
     return filename
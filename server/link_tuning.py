@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+
+LINK_TUNING_PATH = os.getenv("LINK_TUNING", "link_tuning.json")
+MIN_CHUNK_SIZE = 64
+MIN_ACK_TIMEOUT = 0.25
+# Chunks sent at one size before its goodput is compared with the last one.
+PROBE_CHUNKS = 12
+# NAKs within one probe window that make the size step down at once.
+MAX_WINDOW_ERRORS = 2
+RTT_GAIN = 0.125
+RTTVAR_GAIN = 0.25
+
+_lock = threading.Lock()
+
+def _read(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def load(port, path=LINK_TUNING_PATH):
+    return _read(path).get(str(port), {}) if path else {}
+
+def save(port, values, path=LINK_TUNING_PATH):
+    if not path:
+        return
+    with _lock:
+        tuning = _read(path)
+        tuning[str(port)] = dict(values, updated=time.time())
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(tuning, f, indent=2, sort_keys=True)
+            os.replace(path + ".tmp", path)
+        except OSError as exc:
+            print(f"[link tuning] Could not save {path}: {exc}")
+
+def _even_size(size, max_chunk):
+    # The panel converts byte pairs, so every chunk but the last stays even.
+    return max(MIN_CHUNK_SIZE, min(int(size), max_chunk)) & ~1
+
+class LinkTuner:
+    # Picks the chunk size and ACK timeout for one port while an upload runs.
+    # The size doubles after PROBE_CHUNKS clean chunks and is kept only when
+    # goodput (bytes acknowledged per second, NAKed chunks included) beats
+    # the size before it; repeated NAKs halve it, and so does a stall, which
+    # also rules out growing back during this upload. The timeout
+    # follows the smoothed RTT the way TCP derives its RTO, bounded by
+    # max_timeout. State from the last upload on the port is the start point.
+    def __init__(self, chunk_size, max_chunk, max_timeout, srtt=None, rttvar=None):
+        self.max_chunk = max_chunk
+        self.max_timeout = max_timeout
+        self.chunk_size = _even_size(chunk_size, max_chunk)
+        self.srtt = srtt
+        self.rttvar = rttvar
+        self._goodput = {}
+        self._previous = None
+        self._ceiling = max_chunk
+        self._reset_window()
+
+    @classmethod
+    def for_port(cls, port, default_chunk, max_chunk, max_timeout, path=LINK_TUNING_PATH):
+        saved = load(port, path)
+        return cls(
+            saved.get("chunk_size", default_chunk),
+            max_chunk,
+            max_timeout,
+            saved.get("srtt"),
+            saved.get("rttvar"),
+        )
+
+    @property
+    def ack_timeout(self):
+        if self.srtt is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(MIN_ACK_TIMEOUT, self.srtt + 4 * self.rttvar))
+
+    def _resize(self, size):
+        size = _even_size(size, self.max_chunk)
+        if size == self.chunk_size:
+            return
+        if self.srtt is not None:
+            # A larger line takes proportionally longer at worst; scaling
+            # keeps the timeout safe until new samples arrive.
+            scale = size / self.chunk_size
+            self.srtt *= scale
+            self.rttvar *= scale
+        self._previous = self.chunk_size
+        self.chunk_size = size
+        self._reset_window()
+
+    def _reset_window(self):
+        self._acked = 0
+        self._seconds = 0.0
+        self._chunks = 0
+        self._errors = 0
+
+    def _observe_rtt(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar += RTTVAR_GAIN * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += RTT_GAIN * (rtt - self.srtt)
+
+    def _record_goodput(self):
+        goodput = self._acked / self._seconds if self._seconds else 0.0
+        self._goodput[self.chunk_size] = goodput
+        return goodput
+
+    def _evaluate(self):
+        goodput = self._record_goodput()
+        grew = self._previous is not None and self._previous < self.chunk_size
+        if grew and goodput <= self._goodput.get(self._previous, 0.0):
+            # The bigger size did not pay off; stay below it for this upload.
+            self._ceiling = self.chunk_size - 1
+            self._resize(self._previous)
+        elif self.chunk_size * 2 <= self._ceiling:
+            self._resize(self.chunk_size * 2)
+        else:
+            self._reset_window()
+
+    def observe(self, length, seconds, rtt, ok):
+        # seconds runs from writing the line to its reply, rtt from the
+        # flush; only acknowledged bytes count towards goodput.
+        self._seconds += seconds
+        self._chunks += 1
+        if ok:
+            self._acked += length
+            self._observe_rtt(rtt)
+        else:
+            self._errors += 1
+            if self._errors >= MAX_WINDOW_ERRORS:
+                # Growing back is allowed only if this size still wins on
+                # goodput, which counts the time lost to the NAKs.
+                self._record_goodput()
+                self._resize(self.chunk_size // 2)
+                return
+        if self._chunks >= PROBE_CHUNKS:
+            self._evaluate()
+
+    def stalled(self):
+        # No reply at all: send smaller lines and back the timeout off.
+        self._ceiling = self.chunk_size - 1
+        self._resize(self.chunk_size // 2)
+        if self.srtt is not None:
+            self.srtt = min(self.max_timeout, self.srtt * 2)
+
+    def state(self):
+        return {
+            "chunk_size": self.chunk_size,
+            "ack_timeout": round(self.ack_timeout, 4),
+            "srtt": None if self.srtt is None else round(self.srtt, 6),
+            "rttvar": None if self.rttvar is None else round(self.rttvar, 6),
+        }
@@ -1,46 +1,398 @@
+import io
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 import calendar_api
+import compositor
+import control_api
+import displays
+import event_store
+import fonts
+import frame_codec
 import generate_image
+import metrics
+import prerender
+import render_worker
 import send_image
 
 CHECK_INTERVAL_SECONDS = 10 * 60
 
-def _events_signature(events):
-    return [
+def _events_signature(events, stale_label=None):
+    return {
+        "events": [
+            {
+                "summary": event["summary"],
+                "start": event["start"].isoformat(),
+                "end": event["end"].isoformat(),
+                "all_day": event["all_day"],
+            }
+            for event in events
+        ],
+        "stale": stale_label,
+    }
+
+def _create_image(**kwargs):
+    # Returns an image path, or with the render worker a pixel array that is
+    # only valid until the next render.
+    if render_worker.RENDER_WORKER:
+        return render_worker.get_worker().render(layered=compositor.RENDER_LAYERED, **kwargs)
+    if compositor.RENDER_LAYERED:
+        return compositor.create_layered_image(**kwargs)
+    return generate_image.create_time_image(**kwargs)
+
+def _render_fields(render_metrics):
+    fields = {"render_seconds": render_metrics.get("render_seconds")}
+    if render_worker.RENDER_WORKER:
+        worker = render_worker.get_worker()
+        fields["render_worker_restarts"] = worker.restarts
+        if worker.peak_rss:
+            fields["render_rss_bytes"] = worker.peak_rss
+    return fields
+
+def _image_name(index):
+    if index == 0:
+        return "calendar.jpg"
+    return f"calendar_{index}.jpg"
+
+def _fetch(calendars, store=None, sync=None):
+    fetch_metrics = metrics.CycleMetrics()
+    if store is None:
+        with fetch_metrics.timer("fetch"):
+            events = calendar_api.fetch_events(calendar_ids=calendars)
+        fetch_metrics.set("events", len(events))
+        return events, fetch_metrics.fields
+
+    # Served from the local cache; the network fetch happens in EventSync.
+    # Only calendars that were never synced at all are fetched inline.
+    with fetch_metrics.timer("fetch"):
+        status = store.status(calendars)
+        if status.synced_at is None and status.failed_at is None and sync is not None:
+            sync.sync(calendars)
+            status = store.status(calendars)
+        now = datetime.now().astimezone()
+        events = store.events(calendars, now, now + timedelta(days=event_store.SYNC_DAYS))
+    fetch_metrics.update(
         {
-            "summary": event["summary"],
-            "start": event["start"].isoformat(),
-            "end": event["end"].isoformat(),
-            "all_day": event["all_day"],
+            "events": len(events),
+            "events_stale": status.stale,
+            "stale_label": status.label(),
+            "fetch_error": status.error,
+        }
+    )
+    return events, fetch_metrics.fields
+
+def _skip(display, group_fields, reason):
+    cycle_metrics = metrics.CycleMetrics(display.name, display.port)
+    cycle_metrics.update(group_fields)
+    cycle_metrics.update({"result": "skipped", "skip_reason": reason})
+    metrics.REGISTRY.record(cycle_metrics)
+
+def _pack(display, image, frames, cycle_metrics=None):
+    # Displays with the same quantize key share one packed frame; each of
+    # them reports its pack time, flagged when the frame was reused.
+    shared = display.quantize_key in frames
+    if not shared:
+        pack_metrics = metrics.CycleMetrics()
+        with pack_metrics.timer("pack"):
+            raw_data = send_image.process_image(image, display.dither, display.calibration())
+        frames[display.quantize_key] = (raw_data, pack_metrics.get("pack_seconds"))
+    raw_data, pack_seconds = frames[display.quantize_key]
+    if cycle_metrics is not None:
+        cycle_metrics.update({"pack_seconds": pack_seconds, "pack_shared": shared})
+    return raw_data
+
+def _upload(uploads, states, superseded=None):
+    jobs = []
+    outcome = {}
+    for display, raw_data, signature, date, cycle_metrics in uploads:
+        if superseded is not None and superseded(display):
+            # A newer trigger for this panel is already queued and will render
+            # from fresher state; sending this frame would only cost a refresh.
+            print(f"[main] Dropped superseded frame for {display.name}.")
+            cycle_metrics.update({"result": "skipped", "skip_reason": "superseded"})
+            metrics.REGISTRY.record(cycle_metrics)
+            outcome[display.name] = "superseded"
+            continue
+        state = states[display.port]
+        mode, changed = state.policy.choose(raw_data, force_full=state.date != date)
+        regions = compositor.changed_regions(state.policy.previous, frame_codec.unpack_levels(raw_data))
+        cycle_metrics.update({"changed_fraction": round(changed, 5), "changed_regions": regions})
+        jobs.append((display, raw_data, signature, date, cycle_metrics, mode))
+    if not jobs:
+        return outcome
+
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        results = list(
+            pool.map(
+                lambda job: send_image.send_frame(job[1], job[0].port, job[4], job[5]),
+                jobs,
+            )
+        )
+
+    now = time.time()
+    for (display, raw_data, signature, date, cycle_metrics, mode), sent in zip(jobs, results):
+        state = states[display.port]
+        if sent:
+            state.mark_sent(signature, date)
+            # send_frame records the mode the panel actually refreshed with.
+            state.policy.commit(raw_data, cycle_metrics.get("mode", mode))
+            cycle_metrics.set("result", "sent")
+        else:
+            state.mark_failed(now)
+            cycle_metrics.update({"result": "failed", "failures": state.failures})
+            print(f"[main] Upload to {display.name} failed. Retry in {state.retry_at - now:.0f}s.")
+        metrics.REGISTRY.record(cycle_metrics)
+        outcome[display.name] = cycle_metrics.get("result")
+    return outcome
+
+def _prerender(index, layout, members, events, signature, stale_label, queue):
+    now = datetime.now().astimezone()
+    at = prerender.next_transition(events, now, layout)
+    if at is None:
+        for display in members:
+            queue.drop(display.port)
+        return
+    if all(queue.is_current(display.port, at, signature) for display in members):
+        return
+
+    image = _create_image(
+        image_name=f"next_{_image_name(index)}",
+        events=events,
+        template_path=layout,
+        now=at,
+        stale_label=stale_label,
+    )
+    frames = {}
+    for display in members:
+        raw_data = _pack(display, image, frames)
+        queue.put(display.port, prerender.Prerendered(at, raw_data, signature))
+    print(f"[main] Pre-rendered {layout} for {at:%Y-%m-%d %H:%M}.")
+
+def _upload_prerendered(queue, displays_by_port, states):
+    now = time.time()
+    uploads = []
+    for port, frame in queue.pop_due(now).items():
+        display = displays_by_port[port]
+        if not states[port].needs_update(frame.signature, frame.date):
+            continue
+        cycle_metrics = metrics.CycleMetrics(display.name, display.port)
+        cycle_metrics.update(
+            {
+                "layout": display.layout,
+                "dither": display.dither,
+                "prerendered": True,
+                "boundary_lag_seconds": round(now - frame.at.timestamp(), 3),
+            }
+        )
+        uploads.append((display, frame.raw_data, frame.signature, frame.date, cycle_metrics))
+    if uploads:
+        _upload(uploads, states)
+
+def _run_cycle(groups, states, queue, superseded=None, fetch=_fetch):
+    current_date = datetime.now().date()
+    events_by_calendars = {}
+    fetched = []
+    uploads = []
+
+    for index, ((calendars, layout), members) in enumerate(groups.items()):
+        if calendars not in events_by_calendars:
+            events_by_calendars[calendars] = fetch(calendars)
+        events, fetch_fields = events_by_calendars[calendars]
+        stale_label = fetch_fields.get("stale_label")
+        signature = _events_signature(events, stale_label)
+        fetched.append((index, layout, members, events, signature, stale_label))
+        group_fields = {
+            "layout": layout,
+            "fetch_seconds": fetch_fields["fetch_seconds"],
+            "events": fetch_fields["events"],
         }
-        for event in events
-    ]
+        if "events_stale" in fetch_fields:
+            group_fields["events_stale"] = fetch_fields["events_stale"]
+
+        now = time.time()
+        targets = []
+        for display in members:
+            state = states[display.port]
+            if not state.needs_update(signature, current_date):
+                _skip(display, group_fields, "unchanged")
+            elif not state.can_retry(now):
+                _skip(display, group_fields, "retry_backoff")
+            elif superseded is not None and superseded(display):
+                _skip(display, group_fields, "superseded")
+            else:
+                targets.append(display)
+        if not targets:
+            print(f"[main] No calendar or date changes for {layout}. Skip image update.")
+            continue
+
+        render_metrics = metrics.CycleMetrics()
+        with render_metrics.timer("render"):
+            image = _create_image(
+                image_name=_image_name(index),
+                events=events,
+                template_path=layout,
+                stale_label=stale_label,
+            )
+        group_fields.update(_render_fields(render_metrics))
+
+        frames = {}
+        for display in targets:
+            cycle_metrics = metrics.CycleMetrics(display.name, display.port)
+            cycle_metrics.update(group_fields)
+            raw_data = _pack(display, image, frames, cycle_metrics)
+            cycle_metrics.set("dither", display.dither)
+            uploads.append((display, raw_data, signature, current_date, cycle_metrics))
+
+    outcome = _upload(uploads, states, superseded) if uploads else {}
+
+    # Render upcoming transitions only after this cycle's uploads went out.
+    for index, layout, members, events, signature, stale_label in fetched:
+        _prerender(index, layout, members, events, signature, stale_label, queue)
+    return outcome
+
+def _next_wakeup(states):
+    delay = CHECK_INTERVAL_SECONDS
+    now = time.time()
+    for state in states.values():
+        if state.failures:
+            delay = min(delay, max(0.0, state.retry_at - now))
+    return delay
+
+class Runtime:
+    def __init__(self, registry, work=None, store=None, sync=None):
+        self.work = work
+        self.store = store
+        self.sync = sync
+        self.states = {}
+        self.registry = []
+        self.queue = prerender.PrerenderQueue()
+        self.configure(registry)
+
+    def configure(self, registry):
+        # Keep state (and with it the last frame) only for displays whose
+        # rendering did not change, so everything else is redrawn.
+        previous = {display.port: display for display in self.registry}
+        states = {}
+        for display in registry:
+            old = previous.get(display.port)
+            unchanged = (
+                old is not None
+                and old.render_key == display.render_key
+                and old.quantize_key == display.quantize_key
+            )
+            states[display.port] = self.states[display.port] if unchanged else displays.DisplayState()
+        for port in previous:
+            self.queue.drop(port)
+        self.registry = registry
+        self.groups = displays.group_by_render_key(registry)
+        self.displays_by_port = {display.port: display for display in registry}
+        self.states = states
+        if self.sync is not None:
+            self.sync.calendar_sets = list({display.calendars for display in registry})
+
+    def fetch(self, calendars):
+        return _fetch(calendars, self.store, self.sync)
+
+    def superseded(self, display):
+        if self.work is None:
+            return False
+        refresh = self.work.pending(("refresh",))
+        if refresh is not None and (refresh.payload is None or display.name in refresh.payload):
+            return True
+        return self.work.pending(("push", display.port)) is not None
+
+    def run_cycle(self):
+        return _run_cycle(self.groups, self.states, self.queue, self.superseded, self.fetch)
+
+def _refresh(runtime, targets):
+    for display in runtime.registry:
+        if targets is None or display.name in targets:
+            state = runtime.states[display.port]
+            state.signature = None
+            state.retry_at = 0.0
+    return runtime.run_cycle()
+
+def _push(runtime, payload):
+    display = next((display for display in runtime.registry if display.name == payload["display"]), None)
+    if display is None:
+        # The display was removed by a config change after the push queued.
+        print(f"[main] Dropped push for {payload['display']}: no longer configured.")
+        return {payload["display"]: "removed"}
+    cycle_metrics = metrics.CycleMetrics(display.name, display.port)
+    if "message" in payload:
+        cycle_metrics.set("pushed", "message")
+        with cycle_metrics.timer("render"):
+            image = generate_image.render_message(payload["message"], f"message_{display.name}.png")
+    else:
+        cycle_metrics.set("pushed", "image")
+        image = io.BytesIO(payload["image"])
+    raw_data = _pack(display, image, {}, cycle_metrics)
+    # The calendar signature is kept, so the pushed frame stays up until the
+    # calendar or the date changes, or a refresh is requested.
+    state = runtime.states[display.port]
+    return _upload(
+        [(display, raw_data, state.signature, state.date, cycle_metrics)],
+        runtime.states,
+        runtime.superseded,
+    )
+
+def _configure(runtime, registry):
+    runtime.configure(registry)
+    print(f"[main] Reconfigured: {len(registry)} display(s), {len(runtime.groups)} distinct layout(s).")
+    return runtime.run_cycle()
+
+JOB_HANDLERS = {
+    "refresh": _refresh,
+    "push": _push,
+    "config": _configure,
+}
+
+def _run_job(job, runtime):
+    try:
+        result = JOB_HANDLERS[job.kind](runtime, job.payload)
+    except Exception as exc:
+        print(f"[main] {job.kind} failed: {exc}")
+        metrics.REGISTRY.record_error(exc)
+        job.future.set_exception(exc)
+    else:
+        job.future.set_result(result)
 
 def main():
-    last_signature = None
-    last_date = None
+    work = control_api.WorkQueue()
+    store = event_store.EventStore()
+    sync = event_store.EventSync(
+        store,
+        [],
+        # No forced targets: the cycle redraws whatever the new events changed.
+        on_change=lambda: work.submit("refresh", [], merge=control_api.merge_targets),
+    )
+    runtime = Runtime(displays.load_displays(), work, store, sync)
+    print(f"[main] {len(runtime.registry)} display(s), {len(runtime.groups)} distinct layout(s).")
+    fonts.preload()
+    metrics.serve()
+    control_api.serve(work, runtime)
+    sync.start()
+
+    next_cycle = time.time()
     while True:
+        ran_cycle = False
         try:
-            events = calendar_api.fetch_events()
-            signature = _events_signature(events)
-            current_date = datetime.now().date()
-            date_changed = current_date != last_date
-            calendar_changed = signature != last_signature
-
-            if calendar_changed or date_changed:
-                image_name = generate_image.create_time_image()
-                time.sleep(1)
-                send_image.send_image_to_pico(image_name)
-                last_signature = signature
-                last_date = current_date
-            else:
-                print("[main] No calendar or date changes. Skip image update.")
+            _upload_prerendered(runtime.queue, runtime.displays_by_port, runtime.states)
+            if time.time() >= next_cycle:
+                ran_cycle = True
+                runtime.run_cycle()
         except Exception as exc:
             print(f"[main] Error: {exc}")
+            metrics.REGISTRY.record_error(exc)
 
-        time.sleep(CHECK_INTERVAL_SECONDS)
+        wakeup = time.time() + _next_wakeup(runtime.states)
+        next_cycle = wakeup if ran_cycle else min(next_cycle, wakeup)
+        due = runtime.queue.next_due()
+        wake_at = next_cycle if due is None else min(next_cycle, due)
+        job = work.get(max(0.0, wake_at - time.time()))
+        if job is not None:
+            _run_job(job, runtime)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_LOG = os.getenv("METRICS_LOG", "metrics.jsonl")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+RTT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 3.0)
+GAUGE_FIELDS = (
+    "fetch_seconds",
+    "events",
+    "render_seconds",
+    "pack_seconds",
+    "upload_seconds",
+    "refresh_seconds",
+    "bytes_sent",
+    "chunk_size",
+    "ack_timeout",
+)
+COUNTER_FIELDS = ("bytes_sent", "chunks_sent", "chunk_retransmits")
+
+class Histogram:
+    def __init__(self, buckets=RTT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+
+    def to_dict(self):
+        return {
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+            "count": self.count,
+            "sum": round(self.sum, 6),
+        }
+
+class CycleMetrics:
+    def __init__(self, display=None, port=None):
+        self.fields = {"ts": time.time(), "display": display, "port": port}
+        self.ack_rtt = Histogram()
+
+    def set(self, name, value):
+        self.fields[name] = value
+
+    def update(self, values):
+        self.fields.update(values)
+
+    def add(self, name, amount=1):
+        self.fields[name] = self.fields.get(name, 0) + amount
+
+    def get(self, name, default=None):
+        return self.fields.get(name, default)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.fields[f"{name}_seconds"] = round(time.perf_counter() - start, 6)
+
+    def to_dict(self):
+        record = dict(self.fields)
+        record["ack_rtt"] = self.ack_rtt.to_dict()
+        return record
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+class MetricsRegistry:
+    def __init__(self, log_path=METRICS_LOG):
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._last = {}
+        self._totals = {}
+        self._results = {}
+        self._rtt = {}
+        self.cycle_errors = 0
+
+    def record(self, metrics):
+        record = metrics.to_dict()
+        display = record.get("display") or "default"
+        with self._lock:
+            self._last[display] = record
+            result_key = (display, record.get("result", "unknown"), record.get("skip_reason", ""))
+            self._results[result_key] = self._results.get(result_key, 0) + 1
+            totals = self._totals.setdefault(display, {})
+            for name in COUNTER_FIELDS:
+                totals[name] = totals.get(name, 0) + record.get(name, 0)
+            self._rtt.setdefault(display, Histogram()).merge(metrics.ack_rtt)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def record_error(self, error):
+        with self._lock:
+            self.cycle_errors += 1
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"ts": time.time(), "result": "error", "error": str(error)}) + "\n")
+
+    def last_cycle(self):
+        with self._lock:
+            return dict(self._last)
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            lines.append("# TYPE eink_refresh_cycles_total counter")
+            for (display, result, reason), count in sorted(self._results.items()):
+                lines.append(
+                    f'eink_refresh_cycles_total{{display="{_label(display)}",result="{_label(result)}",'
+                    f'skip_reason="{_label(reason)}"}} {count}'
+                )
+            lines.append("# TYPE eink_cycle_errors_total counter")
+            lines.append(f"eink_cycle_errors_total {self.cycle_errors}")
+
+            for name in COUNTER_FIELDS:
+                lines.append(f"# TYPE eink_{name}_total counter")
+                for display, totals in sorted(self._totals.items()):
+                    lines.append(f'eink_{name}_total{{display="{_label(display)}"}} {totals.get(name, 0)}')
+
+            for name in GAUGE_FIELDS:
+                lines.append(f"# TYPE eink_last_{name} gauge")
+                for display, record in sorted(self._last.items()):
+                    if record.get(name) is not None:
+                        lines.append(f'eink_last_{name}{{display="{_label(display)}"}} {record[name]}')
+
+            lines.append("# TYPE eink_last_firmware_phase_us gauge")
+            for display, record in sorted(self._last.items()):
+                for key, value in sorted((record.get("firmware") or {}).items()):
+                    if key.endswith("_us"):
+                        lines.append(
+                            f'eink_last_firmware_phase_us{{display="{_label(display)}",phase="{key[:-3]}"}} {value}'
+                        )
+            lines.append("# TYPE eink_last_firmware_mem_free_bytes gauge")
+            for display, record in sorted(self._last.items()):
+                mem_free = (record.get("firmware") or {}).get("mem_free")
+                if mem_free is not None:
+                    lines.append(f'eink_last_firmware_mem_free_bytes{{display="{_label(display)}"}} {mem_free}')
+
+            lines.append("# TYPE eink_ack_rtt_seconds histogram")
+            for display, histogram in sorted(self._rtt.items()):
+                label = _label(display)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'eink_ack_rtt_seconds_bucket{{display="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'eink_ack_rtt_seconds_bucket{{display="{label}",le="+Inf"}} {histogram.count}')
+                lines.append(f'eink_ack_rtt_seconds_sum{{display="{label}"}} {histogram.sum}')
+                lines.append(f'eink_ack_rtt_seconds_count{{display="{label}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = self.registry.render_prometheus().encode()
+            content_type = "text/plain; version=0.0.4"
+        elif self.path == "/last":
+            body = json.dumps(self.registry.last_cycle(), ensure_ascii=False, default=str).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port=METRICS_PORT, host="127.0.0.1"):
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"[metrics] serving http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,237 @@
+import argparse
+import binascii
+import random
+import socket
+import threading
+import time
+
+import transport
+
+# Mirrors the receive loop in firmware/main.py (including resumable uploads)
+# so the upload path can be exercised and benchmarked without a Pico.
+TOTAL_SIZE = 96000
+SEND_QUERY = "CAN_SEND"
+SEND_OK = "YES"
+SEND_BUSY = "BUSY"
+REFRESH_MODES = ("FULL", "FAST", "PART")
+MAX_CHUNK_SIZE = 2048
+
+class PicoEmulator:
+    def __init__(
+        self,
+        latency=0.0,
+        error_rate=0.0,
+        drop_rate=0.0,
+        busy_replies=0,
+        refresh_seconds=0.0,
+        mem_free=150000,
+        max_chunk=MAX_CHUNK_SIZE,
+        seed=None,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.busy_replies = busy_replies
+        self.refresh_seconds = refresh_seconds
+        self.mem_free = mem_free
+        self.max_chunk = max_chunk
+        self.frames = []
+        self.modes = []
+        self.chunks_received = 0
+        # Like EPD_7in5.plane_13_shown: a partial refresh needs the last
+        # completed frame as old data, otherwise the firmware uses FAST.
+        self.shown = False
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_options(cls, options):
+        return cls(
+            latency=float(options.get("latency", 0.0)),
+            error_rate=float(options.get("error_rate", 0.0)),
+            drop_rate=float(options.get("drop_rate", 0.0)),
+            busy_replies=int(options.get("busy_replies", 0)),
+            refresh_seconds=float(options.get("refresh_seconds", 0.0)),
+            mem_free=int(options.get("mem_free", 150000)),
+            max_chunk=int(options.get("max_chunk", MAX_CHUNK_SIZE)),
+            seed=options.get("seed"),
+        )
+
+    @property
+    def last_frame(self):
+        return self.frames[-1] if self.frames else None
+
+    def _print(self, link, message):
+        link.write(f"{message}\n".encode())
+
+    def _handshake(self, link, line, upload):
+        fields = {}
+        for token in line.split()[1:]:
+            key, _, value = token.partition("=")
+            fields[key] = value
+        if self.busy_replies > 0:
+            self.busy_replies -= 1
+            self._print(link, SEND_BUSY)
+            return upload
+        if upload and upload.frame_id and upload.frame_id == fields.get("id"):
+            self._print(link, f"{SEND_OK} off={upload.pos} max={self.max_chunk}")
+            return upload
+        mode = fields.get("mode", "FULL")
+        if mode not in REFRESH_MODES:
+            self._print(link, "ERR:MODE")
+            return None
+        self._print(link, f"{SEND_OK} off=0 max={self.max_chunk}" if "id" in fields else SEND_OK)
+        if mode == "PART" and not self.shown:
+            mode = "FAST"
+        self.shown = False
+        crc = fields.get("crc")
+        return _Upload(fields.get("id"), int(crc, 16) if crc else None, mode)
+
+    def _receive_chunk(self, link, upload, line):
+        t0 = time.perf_counter()
+        if self._random.random() < self.drop_rate:
+            return True
+        offset = None
+        chunk_crc = None
+        if upload.frame_id is None:
+            hex_data = line
+        else:
+            parts = line.split()
+            if len(parts) != 3 or len(parts[2]) > 2 * self.max_chunk:
+                self._print(link, f"NAK {upload.pos}")
+                return True
+            hex_data = parts[2]
+
+        if self._random.random() < self.error_rate:
+            if upload.frame_id is None:
+                self._print(link, "ERR:injected")
+                return False
+            self._print(link, f"NAK {upload.pos}")
+            return True
+
+        try:
+            if upload.frame_id is not None:
+                offset = int(parts[0])
+                chunk_crc = int(parts[1], 16)
+            chunk_data = binascii.unhexlify(hex_data)
+        except Exception as e:
+            if upload.frame_id is None:
+                self._print(link, f"ERR:{e}")
+                return False
+            self._print(link, f"NAK {upload.pos}")
+            return True
+        if offset is not None and offset != upload.pos:
+            self._print(link, f"RESEND {upload.pos}")
+            return True
+        if chunk_crc is not None and binascii.crc32(chunk_data) != chunk_crc:
+            self._print(link, f"NAK {upload.pos}")
+            return True
+
+        length = len(chunk_data)
+        if upload.pos + length > TOTAL_SIZE:
+            self._print(link, "ERR:OVERFLOW")
+            return False
+
+        upload.buffer[upload.pos : upload.pos + length] = chunk_data
+        upload.running_crc = binascii.crc32(chunk_data, upload.running_crc)
+        upload.pos += length
+        upload.stats["hex_us"] += int((time.perf_counter() - t0) * 1_000_000)
+        upload.stats["chunks"] += 1
+        self.chunks_received += 1
+        self._print(link, "OK" if upload.frame_id is None else f"OK {upload.pos}")
+        return True
+
+    def _finish(self, link, upload):
+        if upload.crc is not None and upload.running_crc != upload.crc:
+            self._print(link, "ERR:HASH")
+            return
+        if self.refresh_seconds:
+            time.sleep(self.refresh_seconds)
+        self.frames.append(bytes(upload.buffer))
+        self.shown = True
+        self.modes.append(upload.mode)
+        self._print(link, "DONE")
+        self._print(link, self._stats_line(upload.stats, upload.mode))
+
+    def _stats_line(self, stats, mode):
+        refresh_us = int(self.refresh_seconds * 1_000_000)
+        fields = (
+            ("rx_us", stats["rx_us"]),
+            ("hex_us", stats["hex_us"]),
+            ("init_us", 0),
+            ("conv_us", 0),
+            ("idle_us", refresh_us),
+            ("sleep_us", 0),
+            ("chunks", stats["chunks"]),
+            ("mode", mode),
+            ("mem_start", self.mem_free),
+            ("mem_free", self.mem_free),
+        )
+        return "STATS " + " ".join(f"{key}={value}" for key, value in fields)
+
+    def run(self, link):
+        upload = None
+        try:
+            while True:
+                t0 = time.perf_counter()
+                line = link.readline()
+                if not line:
+                    break
+                if upload:
+                    upload.stats["rx_us"] += int((time.perf_counter() - t0) * 1_000_000)
+                line = line.decode("utf-8", errors="ignore").strip()
+                if not line:
+                    continue
+                if line.startswith(SEND_QUERY):
+                    upload = self._handshake(link, line, upload)
+                    continue
+                if upload is None:
+                    continue
+
+                if self.latency:
+                    time.sleep(self.latency)
+                if not self._receive_chunk(link, upload, line):
+                    upload = None
+                    continue
+                if upload.pos >= TOTAL_SIZE:
+                    self._finish(link, upload)
+                    upload = None
+        except (BrokenPipeError, ConnectionError, OSError):
+            pass
+        finally:
+            link.close()
+
+class _Upload:
+    def __init__(self, frame_id, crc, mode):
+        self.frame_id = frame_id
+        self.crc = crc
+        self.mode = mode
+        self.running_crc = 0
+        self.pos = 0
+        self.buffer = bytearray(TOTAL_SIZE)
+        self.stats = {"rx_us": 0, "hex_us": 0, "chunks": 0}
+
+def serve(host, port, options):
+    server = socket.create_server((host, port))
+    print(f"[pico emulator] listening on tcp://{host}:{port}")
+    while True:
+        conn, address = server.accept()
+        print(f"[pico emulator] connection from {address[0]}:{address[1]}")
+        emulator = PicoEmulator.from_options(options)
+        link = transport.SocketTransport(sock=conn)
+        threading.Thread(target=emulator.run, args=(link,), daemon=True).start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate the Pico receive loop over TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--busy-replies", type=int, default=0)
+    parser.add_argument("--refresh-seconds", type=float, default=0.0)
+    parser.add_argument("--max-chunk", type=int, default=MAX_CHUNK_SIZE)
+    args = parser.parse_args()
+    serve(args.host, args.port, vars(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import os
+from datetime import datetime, time, timedelta
+
+import generate_image
+
+PRERENDER_HORIZON_SECONDS = int(os.getenv("PRERENDER_HORIZON_SECONDS", str(15 * 60)))
+
+def _candidates(events, now):
+    yield datetime.combine(now.date() + timedelta(days=1), time.min, tzinfo=now.tzinfo)
+    for event in events:
+        yield event["start"]
+        yield event["end"]
+
+def next_transition(events, now, template_path, horizon=PRERENDER_HORIZON_SECONDS):
+    # Midnight and event boundaries are known in advance. Only the ones that
+    # actually change the page count; the HTML is cheap to build, so compare
+    # it with a fixed weather label instead of reasoning about the layout.
+    end = now + timedelta(seconds=horizon)
+    candidates = sorted({at for at in _candidates(events, now) if now < at <= end})
+    if not candidates:
+        return None
+    current = generate_image.build_html(events, now=now, weather_label="", template_path=template_path)
+    for at in candidates:
+        upcoming = generate_image.build_html(events, now=at, weather_label="", template_path=template_path)
+        if upcoming != current:
+            return at
+    return None
+
+class Prerendered:
+    def __init__(self, at, raw_data, signature):
+        self.at = at
+        self.raw_data = raw_data
+        self.signature = signature
+
+    @property
+    def date(self):
+        return self.at.date()
+
+class PrerenderQueue:
+    # At most one frame per port: the one for its next transition. Frames are
+    # replaced whenever the events change before the boundary is reached.
+    def __init__(self):
+        self.frames = {}
+
+    def is_current(self, port, at, signature):
+        frame = self.frames.get(port)
+        return frame is not None and frame.at == at and frame.signature == signature
+
+    def put(self, port, frame):
+        self.frames[port] = frame
+
+    def drop(self, port):
+        self.frames.pop(port, None)
+
+    def next_due(self):
+        if not self.frames:
+            return None
+        return min(frame.at.timestamp() for frame in self.frames.values())
+
+    def pop_due(self, now):
+        due = {port: frame for port, frame in self.frames.items() if frame.at.timestamp() <= now}
+        for port in due:
+            del self.frames[port]
+        return due
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+
+import frame_codec
+
+MODE_FULL = "FULL"
+MODE_FAST = "FAST"
+MODE_PART = "PART"
+MODES = (MODE_FULL, MODE_FAST, MODE_PART)
+
+FULL_REFRESH_EVERY = int(os.getenv("FULL_REFRESH_EVERY", "6"))
+PARTIAL_MAX_CHANGE = float(os.getenv("PARTIAL_MAX_CHANGE", "0.03"))
+FAST_MAX_CHANGE = float(os.getenv("FAST_MAX_CHANGE", "0.25"))
+
+class RefreshPolicy:
+    # Picks the refresh mode for one panel. Partial and fast refreshes are
+    # black/white only and leave ghosting behind, so after `full_every` of
+    # them (or on a date change) the next frame is a full 4-gray refresh.
+    def __init__(
+        self,
+        full_every=FULL_REFRESH_EVERY,
+        partial_max_change=PARTIAL_MAX_CHANGE,
+        fast_max_change=FAST_MAX_CHANGE,
+    ):
+        self.full_every = full_every
+        self.partial_max_change = partial_max_change
+        self.fast_max_change = fast_max_change
+        self.previous = None
+        self.since_full = 0
+
+    def changed_fraction(self, frame):
+        if self.previous is None:
+            return 1.0
+        levels = frame_codec.unpack_levels(frame)
+        return np.count_nonzero(levels != self.previous) / levels.size
+
+    def choose(self, frame, force_full=False):
+        changed = self.changed_fraction(frame)
+        if force_full or self.previous is None or self.since_full >= self.full_every:
+            return MODE_FULL, changed
+        if changed <= self.partial_max_change:
+            return MODE_PART, changed
+        if changed <= self.fast_max_change:
+            return MODE_FAST, changed
+        return MODE_FULL, changed
+
+    def commit(self, frame, mode):
+        # previous is what the panel shows. Fast and partial refreshes draw
+        # levels 0-1 black and 2-3 white, so grays they dropped count as
+        # changed pixels and push the next frame towards a full refresh.
+        levels = frame_codec.unpack_levels(frame)
+        if mode != MODE_FULL:
+            levels = np.where(levels >= 2, 3, 0)
+        self.previous = levels.astype(np.uint8)
+        self.since_full = 0 if mode == MODE_FULL else self.since_full + 1
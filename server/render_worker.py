@@ -0,0 +1,202 @@
+import atexit
+import multiprocessing
+import os
+import signal
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+RENDER_WORKER = os.getenv("RENDER_WORKER", "1") == "1"
+RENDER_TIMEOUT_SECONDS = float(os.getenv("RENDER_TIMEOUT_SECONDS", "90"))
+RENDER_MAX_RSS_MB = float(os.getenv("RENDER_MAX_RSS_MB", "800"))
+WATCHDOG_POLL_SECONDS = 0.5
+WIDTH = 800
+HEIGHT = 480
+
+class RenderError(RuntimeError):
+    pass
+
+class RenderTimeout(RenderError):
+    pass
+
+def _descendants(pid):
+    found = []
+    pending = [pid]
+    while pending:
+        parent = pending.pop()
+        try:
+            tids = os.listdir(f"/proc/{parent}/task")
+        except OSError:
+            continue
+        for tid in tids:
+            try:
+                with open(f"/proc/{parent}/task/{tid}/children") as f:
+                    children = [int(child) for child in f.read().split()]
+            except OSError:
+                continue
+            found.extend(children)
+            pending.extend(children)
+    return found
+
+def tree_rss(pid):
+    # Resident memory of the worker plus everything it spawned (Chromium),
+    # in bytes. None where /proc is not available.
+    if not os.path.exists(f"/proc/{pid}/statm"):
+        return None
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for member in [pid] + _descendants(pid):
+        try:
+            with open(f"/proc/{member}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+def _serve(conn, shm_name):
+    # Own process group, so a kill also takes down the browser it started.
+    if hasattr(os, "setsid"):
+        os.setsid()
+    import compositor
+    import generate_image
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    pixels = np.ndarray((HEIGHT, WIDTH), dtype=np.uint8, buffer=shm.buf)
+    try:
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            layered, kwargs = request
+            try:
+                create = compositor.create_layered_image if layered else generate_image.create_time_image
+                filename = create(**kwargs)
+                with Image.open(filename) as img:
+                    img = img.convert("L")
+                    if img.size != (WIDTH, HEIGHT):
+                        img = img.resize((WIDTH, HEIGHT), Image.Resampling.LANCZOS)
+                    pixels[:] = np.asarray(img)
+                conn.send(("ok", filename))
+            except Exception as exc:
+                conn.send(("error", f"{type(exc).__name__}: {exc}"))
+    finally:
+        del pixels
+        shm.close()
+
+class RenderWorker:
+    # Runs the headless render in a child process. The result comes back
+    # through a shared 800x480 buffer; a render that hangs, or a worker that
+    # grows past max_rss_mb, gets the whole process group killed and a fresh
+    # worker on the next call. target is the function the worker runs,
+    # called with the pipe end and the shared buffer name.
+    def __init__(self, timeout=RENDER_TIMEOUT_SECONDS, max_rss_mb=RENDER_MAX_RSS_MB, target=_serve):
+        self.timeout = timeout
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.target = target
+        # Workers started after the first, whether killed or recycled.
+        self.restarts = 0
+        self._started = False
+        self.peak_rss = None
+        self._context = multiprocessing.get_context("spawn")
+        self._shm = shared_memory.SharedMemory(create=True, size=WIDTH * HEIGHT)
+        self.pixels = np.ndarray((HEIGHT, WIDTH), dtype=np.uint8, buffer=self._shm.buf)
+        self._process = None
+        self._conn = None
+        atexit.register(self.close)
+
+    def _start(self):
+        parent, child = self._context.Pipe()
+        if self._started:
+            self.restarts += 1
+        self._started = True
+        self._process = self._context.Process(
+            target=self.target,
+            args=(child, self._shm.name),
+            name="render-worker",
+            daemon=True,
+        )
+        self._process.start()
+        child.close()
+        self._conn = parent
+
+    def _kill(self, reason):
+        print(f"[render worker] restarting: {reason}")
+        process = self._process
+        if process.is_alive():
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except (AttributeError, OSError):
+                process.kill()
+        process.join(5)
+        self._conn.close()
+        self._process = None
+        self._conn = None
+
+    def _stop(self):
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._process.join(5)
+        if self._process.is_alive():
+            self._kill("did not exit")
+            return
+        self._conn.close()
+        self._process = None
+        self._conn = None
+
+    def render(self, layered=False, **kwargs):
+        # The returned array is a view of the shared buffer and stays valid
+        # until the next render; pack it before rendering again.
+        if self._process is None:
+            self._start()
+        self._conn.send((layered, kwargs))
+        deadline = time.monotonic() + self.timeout
+        peak = 0
+        while not self._conn.poll(WATCHDOG_POLL_SECONDS):
+            rss = tree_rss(self._process.pid)
+            if rss is not None:
+                peak = max(peak, rss)
+                if rss > self.max_rss:
+                    self._kill(f"RSS {rss / 2**20:.0f} MB over limit")
+                    raise RenderError("render worker exceeded its memory limit")
+            if not self._process.is_alive():
+                self._kill("worker exited")
+                raise RenderError("render worker died")
+            if time.monotonic() > deadline:
+                self._kill(f"no result after {self.timeout:.0f}s")
+                raise RenderTimeout(f"render took longer than {self.timeout:.0f}s")
+        try:
+            status, detail = self._conn.recv()
+        except (EOFError, OSError):
+            self._kill("pipe closed")
+            raise RenderError("render worker died")
+        self.peak_rss = peak or tree_rss(self._process.pid)
+
+        # Memory freed inside the worker is rarely returned to the OS, so a
+        # worker that has grown too large is recycled between renders.
+        rss = tree_rss(self._process.pid)
+        if rss is not None and rss > self.max_rss:
+            self._stop()
+        if status != "ok":
+            raise RenderError(detail)
+        return self.pixels
+
+    def close(self):
+        if self._process is not None:
+            self._stop()
+        if self._shm is not None:
+            del self.pixels
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+_WORKER = None
+
+def get_worker():
+    global _WORKER
+    if _WORKER is None:
+        _WORKER = RenderWorker()
+    return _WORKER
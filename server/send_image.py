@@ -1,8 +1,15 @@
-import serial
 import time
 import numpy as np
 from PIL import Image
 import binascii
+import hashlib
+import zlib
+
+import dither as dither_lib
+import frame_codec
+import link_tuning
+import metrics as metrics_lib
+import transport
 
 PORT = '/dev/ttyACM0' 
 BAUDRATE = 115200 
@@ -14,108 +21,301 @@ SEND_QUERY = "CAN_SEND"
 SEND_OK = "YES"
 SEND_BUSY = "BUSY"
 SEND_ERR_PREFIX = "ERR"
+STATS_PREFIX = "STATS"
+STATS_TIMEOUT = 1.0
+ACK_OK = "OK"
+ACK_NAK = "NAK"
+ACK_RESEND = "RESEND"
+ERR_HASH = "ERR:HASH"
+ACK_TIMEOUT = 3
+REFRESH_TIMEOUT = 120
+MAX_ATTEMPTS = 5
+MAX_NAKS = 5
+RETRY_BACKOFF = 0.5
+MODE_FULL = "FULL"
+# Ports whose firmware only answered the bare CAN_SEND. They skip the
+# extended handshake until the server restarts.
+_LEGACY_PORTS = set()
+
+def _parse_fields(tokens):
+    fields = {}
+    for token in tokens:
+        key, _, value = token.partition("=")
+        fields[key] = value
+    return fields
 
-def request_send_permission(ser, max_attempts=5, wait_seconds=2, timeout=2):
+def request_send_permission(ser, query=SEND_QUERY, max_attempts=5, wait_seconds=2, timeout=2, fallback_query=None):
+    # Returns the key=value fields of the YES reply ({} for firmware that
+    # answers a bare YES), or None when the Pico refuses or never answers.
+    # Firmware older than the id/crc handshake ignores anything but a bare
+    # CAN_SEND, so when the Pico stays silent fallback_query is tried once.
+    answered = False
     for attempt in range(max_attempts):
-        ser.write(f"{SEND_QUERY}\n".encode())
+        ser.write(f"{query}\n".encode())
         ser.flush()
         start = time.time()
         while time.time() - start < timeout:
             if ser.in_waiting:
                 line = ser.readline().decode('utf-8', errors='ignore').strip()
-                if line == SEND_OK:
-                    return True
+                tokens = line.split()
+                if tokens and tokens[0] == SEND_OK:
+                    return _parse_fields(tokens[1:])
                 if line == SEND_BUSY:
                     print("Pico busy. Retrying...")
+                    answered = True
                     break
                 if line.startswith(SEND_ERR_PREFIX):
                     print(f"Pico error: {line}")
-                    return False
+                    return None
             time.sleep(0.01)
         if attempt < max_attempts - 1:
             time.sleep(wait_seconds)
+    if fallback_query is not None and not answered:
+        print("[send image] No reply to the extended handshake. Trying a bare CAN_SEND.")
+        return request_send_permission(ser, fallback_query, 1, wait_seconds, timeout)
     print("[send image] No response from Pico. Try again later.")
-    return False
-
-def process_image(image_path):
-    img = Image.open(image_path).convert('L')
-    img = img.resize((WIDTH, HEIGHT), Image.Resampling.LANCZOS)
-    pixels = np.array(img, dtype=np.uint8)
-    pixels = np.digitize(pixels, [64, 128, 192])
-    
-    flat = pixels.flatten()
-    p = flat.reshape(-1, 4)
-    # Pack pixels in reverse order to match byte orientation (3,2,1,0).
-    packed = (p[:, 3] << 6) | (p[:, 2] << 4) | (p[:, 1] << 2) | p[:, 0]
-    return packed.astype(np.uint8).tobytes()
-
-def send_image_to_pico(image_path):
+    return None
+
+def parse_stats(line):
+    stats = {}
+    for field in line[len(STATS_PREFIX):].split():
+        key, _, value = field.partition("=")
+        try:
+            stats[key] = int(value)
+        except ValueError:
+            stats[key] = value
+    return stats
+
+def _read_firmware_stats(ser, timeout=STATS_TIMEOUT):
+    start = time.time()
+    while time.time() - start < timeout:
+        if ser.in_waiting:
+            line = ser.readline().decode('utf-8', errors='ignore').strip()
+            if line.startswith(STATS_PREFIX):
+                return parse_stats(line)
+        time.sleep(0.01)
+    return None
+
+def process_image(image_path, dither="threshold", calibration=None):
+    # Also takes an already rendered 800x480 grayscale array.
+    if isinstance(image_path, np.ndarray):
+        pixels = image_path
+    else:
+        img = Image.open(image_path).convert('L')
+        img = img.resize((WIDTH, HEIGHT), Image.Resampling.LANCZOS)
+        pixels = np.array(img, dtype=np.uint8)
+    if calibration is not None:
+        pixels = calibration[pixels]
+    levels = dither_lib.quantize(pixels, dither)
+    return frame_codec.pack_levels(levels)
+
+def frame_checksum(raw_data):
+    return zlib.crc32(raw_data) & 0xFFFFFFFF
+
+def frame_id(raw_data, mode=""):
+    return hashlib.sha1(raw_data + mode.encode()).hexdigest()[:8]
+
+def _chunk_line(raw_data, offset, resumable, chunk_size=CHUNK_SIZE):
+    chunk = raw_data[offset : offset + chunk_size]
+    hex_chunk = binascii.hexlify(chunk)
+    if not resumable:
+        return hex_chunk + b"\n", len(chunk)
+    return b"%d %08x %s\n" % (offset, zlib.crc32(chunk) & 0xFFFFFFFF, hex_chunk), len(chunk)
+
+def _wait_ack(ser, timeout=ACK_TIMEOUT):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if ser.in_waiting:
+            resp = ser.readline().decode('utf-8', errors='ignore').strip()
+            tokens = resp.split()
+            if not tokens:
+                continue
+            if tokens[0] in (ACK_OK, ACK_NAK, ACK_RESEND):
+                try:
+                    value = int(tokens[1]) if len(tokens) > 1 else None
+                except ValueError:
+                    # A corrupted reply counts as no reply.
+                    continue
+                return tokens[0], value, time.perf_counter() - start
+            if resp.startswith(SEND_ERR_PREFIX):
+                return resp, None, time.perf_counter() - start
+        time.sleep(0.001)
+    return None, None, timeout
+
+def _send_chunks(ser, raw_data, offset, resumable, port, metrics, tuner=None):
+    # Returns "sent" once every byte is acknowledged, "timeout" when the
+    # link stalled (retry and resume) or the firmware error line. Without a
+    # tuner (firmware that does not advertise max=) sizes stay fixed.
+    total = len(raw_data)
+    naks = 0
+    first = True
+    while offset < total:
+        chunk_size = CHUNK_SIZE if tuner is None else tuner.chunk_size
+        line, length = _chunk_line(raw_data, offset, resumable, chunk_size)
+        start = time.perf_counter()
+        ser.write(line)
+        ser.flush()
+        metrics.add("bytes_sent", len(line))
+        metrics.add("chunks_sent")
+
+        # The first chunk after a handshake also waits for the panel to wake.
+        timeout = ACK_TIMEOUT if tuner is None or first else tuner.ack_timeout
+        kind, value, rtt = _wait_ack(ser, timeout)
+        first = False
+        if kind is None:
+            print(f"\n[send image] {port} Timeout at byte {offset}")
+            if tuner is not None:
+                tuner.stalled()
+            return "timeout"
+        if tuner is not None and kind in (ACK_OK, ACK_NAK):
+            tuner.observe(length, time.perf_counter() - start, rtt, kind == ACK_OK)
+        if kind == ACK_OK:
+            metrics.ack_rtt.observe(rtt)
+            offset = value if value is not None else offset + length
+            naks = 0
+        elif kind in (ACK_NAK, ACK_RESEND):
+            metrics.add("chunk_retransmits")
+            naks += 1
+            if naks > MAX_NAKS:
+                return f"{SEND_ERR_PREFIX}:too many NAKs at byte {offset}"
+            offset = value if value is not None else offset
+            continue
+        else:
+            return kind
+
+        percent = (offset / total) * 100
+        print(f"\r[send image] {port} Progress: {percent:.1f}%", end='')
+    return "sent"
+
+def _wait_done(ser, port, metrics, timeout=REFRESH_TIMEOUT):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if ser.in_waiting:
+            line = ser.readline().decode('utf-8', errors='ignore').strip()
+            if "DONE" in line:
+                metrics.set("refresh_seconds", round(time.perf_counter() - start, 6))
+                return "DONE"
+            if line.startswith(SEND_ERR_PREFIX):
+                return line
+        time.sleep(0.1)
+    return None
+
+def send_frame(raw_data, port=PORT, metrics=None, mode=MODE_FULL, tuning_path=link_tuning.LINK_TUNING_PATH):
+    # tuning_path=None tunes the link for this upload only, without loading
+    # or saving per-port state.
+    if metrics is None:
+        metrics = metrics_lib.CycleMetrics(port=port)
+    metrics.update({"bytes_sent": 0, "chunks_sent": 0, "chunk_retransmits": 0, "attempts": 0})
+    upload_start = time.perf_counter()
     ser = None
+    tuner = None
     try:
-        raw_data = process_image(image_path)
         if len(raw_data) != EXPECTED_SIZE:
             print(f"[send image] Size error: {len(raw_data)}")
-            return
-
-        hex_data = binascii.hexlify(raw_data)
-        
-        total_hex_len = len(hex_data)
-
-        ser = serial.Serial(PORT, BAUDRATE, timeout=10)
-        print(f"[send image] {PORT} connected.")
-        ser.reset_input_buffer()
-        ser.reset_output_buffer()
-        
-        if not request_send_permission(ser):
-            return
-
-        print("[send image] Connection successful. Start sending text mode.")
-
-        bytes_sent = 0
-        
-        while bytes_sent < total_hex_len:
-            chunk_len = CHUNK_SIZE * 2
-            chunk = hex_data[bytes_sent : bytes_sent + chunk_len]
-            
-            ser.write(chunk + b'\n')
-            ser.flush()
-            
-            ack_received = False
-            start_ack = time.time()
-            while time.time() - start_ack < 3:
-                if ser.in_waiting:
-                    resp = ser.readline().decode().strip()
-                    if "OK" in resp:
-                        ack_received = True
-                        break
-                    elif "ERR" in resp:
-                        print(f"\n{resp}")
-                        return
-                time.sleep(0.001)
-                
-            if not ack_received:
-                print(f"\n[send image] Timeout")
-                return
-
-            bytes_sent += len(chunk)
-            
-            percent = (bytes_sent / total_hex_len) * 100
-            print(f"\r[send image] Progress: {percent:.1f}%", end='')
-
-        print("\n\n[send image] Sending complete. Waiting for update...")
-        
-        while True:
-            if ser.in_waiting:
-                line = ser.readline().decode().strip()
-                if "DONE" in line:
-                    print("[send image] Success")
-                    break
-            time.sleep(0.1)
+            metrics.set("error", "size")
+            return False
+
+        if port in _LEGACY_PORTS:
+            query = SEND_QUERY
+        else:
+            query = (
+                f"{SEND_QUERY} id={frame_id(raw_data, mode)} "
+                f"crc={frame_checksum(raw_data):08x} size={len(raw_data)} mode={mode}"
+            )
+        metrics.set("mode", mode)
+
+        # Attempts only count against MAX_ATTEMPTS while no progress is made;
+        # every resume that gets further resets the backoff.
+        attempt = 0
+        best_offset = 0
+        while attempt < MAX_ATTEMPTS:
+            if attempt:
+                delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+                print(f"[send image] {port} Retrying in {delay:.1f}s (attempt {attempt + 1}/{MAX_ATTEMPTS})")
+                time.sleep(delay)
+            attempt += 1
+            metrics.add("attempts")
+
+            if ser is None:
+                ser = transport.open_transport(port, BAUDRATE, timeout=10)
+                print(f"[send image] {port} connected.")
+                ser.reset_input_buffer()
+                ser.reset_output_buffer()
+
+            reply = request_send_permission(ser, query, fallback_query=None if query == SEND_QUERY else SEND_QUERY)
+            if reply is None:
+                metrics.set("error", "no_permission")
+                return False
+            if not reply:
+                # Legacy firmware: no resume, no checksum, always a full
+                # 4-gray refresh whatever mode was asked for.
+                if port not in _LEGACY_PORTS:
+                    print(f"[send image] {port} Legacy firmware, using the original protocol.")
+                    _LEGACY_PORTS.add(port)
+                query = SEND_QUERY
+                metrics.update({"mode": MODE_FULL, "legacy_firmware": True})
+
+            resumable = "off" in reply
+            offset = int(reply.get("off", 0))
+            if tuner is None and resumable and "max" in reply:
+                tuner = link_tuning.LinkTuner.for_port(
+                    port, CHUNK_SIZE, int(reply["max"]), ACK_TIMEOUT, tuning_path
+                )
+            if offset:
+                print(f"[send image] {port} Resuming at byte {offset}.")
+                metrics.set("resumed_from", offset)
+            if offset > best_offset:
+                best_offset = offset
+                attempt = 1
+            print("[send image] Connection successful. Start sending text mode.")
+
+            result = _send_chunks(ser, raw_data, offset, resumable, port, metrics, tuner)
+            if result == "timeout" and resumable:
+                metrics.add("chunk_retransmits")
+                continue
+            if result != "sent":
+                print(f"\n[send image] {port} {result}")
+                metrics.set("error", "ack_timeout" if result == "timeout" else result)
+                return False
+
+            print(f"\n\n[send image] {port} Sending complete. Waiting for update...")
+            metrics.set("transfer_seconds", round(time.perf_counter() - upload_start, 6))
+
+            result = _wait_done(ser, port, metrics)
+            if result == "DONE":
+                print(f"[send image] {port} Success")
+                stats = _read_firmware_stats(ser)
+                if stats:
+                    metrics.set("firmware", stats)
+                    # The firmware turns PART into FAST when it has no old
+                    # frame to compare against.
+                    if stats.get("mode"):
+                        metrics.set("mode", stats["mode"])
+                    summary = " ".join(f"{key}={value}" for key, value in stats.items())
+                    print(f"[send image] {port} Firmware stats: {summary}")
+                return True
+            print(f"[send image] {port} {result or 'No DONE from Pico'}")
+            if result != ERR_HASH:
+                metrics.set("error", result or "refresh_timeout")
+                return False
+
+        metrics.set("error", "retries_exhausted")
+        return False
 
     except Exception as e:
-        print(f"\n[send image] Error: {e}")
+        print(f"\n[send image] {port} Error: {e}")
+        metrics.set("error", str(e))
+        return False
     finally:
         if ser: ser.close()
+        if tuner is not None:
+            tuning = tuner.state()
+            metrics.update({"chunk_size": tuning["chunk_size"], "ack_timeout": tuning["ack_timeout"]})
+            link_tuning.save(port, tuning, tuning_path)
+        metrics.set("upload_seconds", round(time.perf_counter() - upload_start, 6))
+
+def send_image_to_pico(image_path, port=PORT):
+    return send_frame(process_image(image_path), port)
 
 if __name__ == "__main__":
     send_image_to_pico("grayscale_gradient.jpg")
\ No newline at end of file
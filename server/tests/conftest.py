@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+from html2image import Html2Image
+
+# The server modules import each other as top-level modules.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+@pytest.fixture
+def chromium():
+    # Frame tests need a real browser; skip them where html2image finds none.
+    try:
+        Html2Image()
+    except FileNotFoundError:
+        pytest.skip("no Chrome/Chromium executable to render with")
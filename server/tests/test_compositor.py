@@ -0,0 +1,70 @@
+import contextlib
+import io
+import os
+
+import numpy as np
+import pytest
+
+import calendar_api
+import compositor
+import frame_codec
+import generate_image
+import send_image
+from test_snapshots import FIXTURES, FROZEN_NOW, LOCAL_TZ, TEMPLATE_PATH, frozen_weather  # noqa: F401
+
+# Fraction of pixels allowed to differ between the layered and the browser
+# render of the same page. Text drawn by PIL is hinted and antialiased
+# differently from Chromium's, so the two never match exactly; a layer at
+# the wrong position or size goes far past this.
+LAYERED_TOLERANCE = float(os.getenv("LAYERED_TOLERANCE", "0.03"))
+
+def test_changed_regions_without_previous_is_whole_frame():
+    frame = np.zeros((compositor.HEIGHT, compositor.WIDTH), dtype=np.uint8)
+    assert compositor.changed_regions(None, frame) == [(0, 0, compositor.WIDTH, compositor.HEIGHT)]
+    assert compositor.changed_regions(frame, frame.copy()) == []
+
+def test_changed_regions_merge_tiles_along_rows():
+    previous = np.zeros((compositor.HEIGHT, compositor.WIDTH), dtype=np.uint8)
+    current = previous.copy()
+    current[0, 0] = 3
+    current[30, 45] = 3
+    current[30, 85] = 3
+    tw, th = compositor.TILE_WIDTH, compositor.TILE_HEIGHT
+    assert compositor.changed_regions(previous, current) == [
+        (0, 0, tw, th),
+        (tw, th, 3 * tw, 2 * th),
+    ]
+
+def test_edited_template_falls_back_to_browser(tmp_path, monkeypatch):
+    template = tmp_path / "index.html"
+    with open(TEMPLATE_PATH, "r", encoding="utf-8") as f:
+        template.write_text(f.read().replace("</body>", "<p>edited</p></body>"), encoding="utf-8")
+    with pytest.raises(compositor.LayoutError):
+        compositor.check_layout(str(template))
+    compositor.check_layout(TEMPLATE_PATH)
+
+    rendered = []
+
+    def create_time_image(**kwargs):
+        rendered.append(kwargs)
+        return kwargs["image_name"]
+
+    monkeypatch.setattr(generate_image, "create_time_image", create_time_image)
+    image_name = str(tmp_path / "calendar.png")
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = compositor.render_layered(image_name=image_name, events=[], template_path=str(template), now=FROZEN_NOW)
+    assert result == (image_name, None)
+    assert rendered[0]["template_path"] == str(template)
+
+@pytest.mark.parametrize("name", sorted(FIXTURES))
+def test_layered_matches_browser(name, frozen_weather, chromium, tmp_path):
+    events = calendar_api.parse_events(FIXTURES[name], LOCAL_TZ)
+    kwargs = {"events": events, "template_path": TEMPLATE_PATH, "now": FROZEN_NOW}
+    with contextlib.redirect_stdout(io.StringIO()):
+        browser = generate_image.create_time_image(image_name=str(tmp_path / "browser.png"), **kwargs)
+        layered, regions = compositor.render_layered(image_name=str(tmp_path / "layered.png"), **kwargs)
+    expected = frame_codec.unpack_levels(send_image.process_image(browser))
+    actual = frame_codec.unpack_levels(send_image.process_image(layered))
+    changed = np.count_nonzero(actual != expected) / actual.size
+    assert changed <= LAYERED_TOLERANCE, f"layered render differs from the browser's by {changed:.4%}"
+    assert regions
@@ -0,0 +1,22 @@
+import asyncio
+
+import pytest
+
+import control_api
+
+@pytest.mark.parametrize("body", [b"[]", b"1", b'"text"', b"null", b"{"])
+def test_json_body_rejects_non_objects(body):
+    with pytest.raises(control_api.ApiError) as info:
+        control_api._json_body(body)
+    assert info.value.status == 400
+
+def test_json_body_defaults_to_empty_object():
+    assert control_api._json_body(b"") == {}
+    assert control_api._json_body(b'{"display": "desk"}') == {"display": "desk"}
+
+@pytest.mark.parametrize("route", ["refresh", "push_message", "put_config"])
+def test_routes_answer_400_for_non_object_bodies(route):
+    api = control_api.ControlApi(work=None, runtime=None)
+    with pytest.raises(control_api.ApiError) as info:
+        asyncio.run(getattr(api, route)({}, b'["desk"]'))
+    assert info.value.status == 400
@@ -0,0 +1,28 @@
+import calendar_api
+import event_store
+
+def _item(summary):
+    return {
+        "summary": summary,
+        "start": {"dateTime": "2999-01-01T10:00:00+09:00"},
+        "end": {"dateTime": "2999-01-01T11:00:00+09:00"},
+    }
+
+def test_one_failing_calendar_leaves_the_others_fresh(monkeypatch, capsys):
+    def fetch_items(calendar_ids, time_min, time_max):
+        if calendar_ids == ["shared"]:
+            raise calendar_api.FetchError("403 forbidden")
+        return {calendar_id: [_item(calendar_id)] for calendar_id in calendar_ids}
+
+    monkeypatch.setattr(calendar_api, "fetch_items", fetch_items)
+    store = event_store.EventStore(":memory:")
+    changes = []
+    sync = event_store.EventSync(store, [["primary", "shared"], ["team"]], on_change=lambda: changes.append(1))
+
+    assert sync.sync_all()
+    assert changes == [1]
+    assert "shared failed" in capsys.readouterr().out
+    assert not store.status(["primary"]).stale
+    assert not store.status(["primary", "team"]).stale
+    status = store.status(["primary", "shared"])
+    assert status.stale and status.error == "403 forbidden"
@@ -0,0 +1,32 @@
+import os
+
+import fonts
+
+def _touch(path, mtime):
+    with open(path, "wb") as f:
+        f.write(b"ttf")
+    os.utime(path, (mtime, mtime))
+
+def test_prune_keeps_newest_subsets(tmp_path, monkeypatch):
+    monkeypatch.setattr(fonts, "FONT_CACHE_DIR", str(tmp_path))
+    for index in range(5):
+        _touch(tmp_path / f"{index}.ttf", 1000 + index)
+    _touch(tmp_path / "notes.txt", 0)
+    fonts._prune_cache(keep=2)
+    assert sorted(os.listdir(tmp_path)) == ["3.ttf", "4.ttf", "notes.txt"]
+
+def test_cache_hit_counts_as_use(tmp_path, monkeypatch):
+    monkeypatch.setattr(fonts, "FONT_CACHE_DIR", str(tmp_path))
+    # A placeholder module: a cached subset never reaches fontTools.
+    monkeypatch.setattr(fonts, "ft_subset", object())
+    font_path = tmp_path / "font.ttc"
+    font_path.write_bytes(b"font")
+    glyphs = frozenset("abc")
+    cached = fonts._subset_path(str(font_path), glyphs)
+    _touch(cached, 1000)
+    _touch(tmp_path / "newer.ttf", 2000)
+
+    assert fonts.subset_font(str(font_path), glyphs) == cached
+    fonts._prune_cache(keep=1)
+    assert os.path.exists(cached)
+    assert not os.path.exists(tmp_path / "newer.ttf")
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import frame_codec
+
+def _reference_firmware_planes(frame):
+    # Straight port of the display_4Gray loops.
+    remap = (2, 0, 3, 1)
+    planes = []
+    for bit_for in ((0, 0, 1, 1), (1, 0, 1, 0)):
+        plane = bytearray(len(frame) // 2)
+        for i in range(len(plane)):
+            temp3 = 0
+            for j in range(2):
+                temp1 = frame[i * 2 + j]
+                for _ in range(4):
+                    temp3 = (temp3 << 1) | bit_for[remap[temp1 & 0x03]]
+                    temp1 >>= 2
+            plane[i] = temp3
+        planes.append(bytes(plane))
+    return tuple(planes)
+
+@pytest.fixture
+def levels():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 4, size=(frame_codec.HEIGHT, frame_codec.WIDTH), dtype=np.uint8)
+
+def test_round_trip(levels):
+    frame = frame_codec.pack_levels(levels)
+    assert len(frame) == frame_codec.FRAME_SIZE
+    assert np.array_equal(frame_codec.unpack_levels(frame), levels)
+
+@pytest.mark.parametrize(
+    "pixels, packed",
+    [
+        ([1, 0, 0, 0], b"\x01"),
+        ([0, 0, 0, 3], b"\xc0"),
+        ([0, 1, 2, 3], bytes([0b11100100])),
+    ],
+)
+def test_byte_orientation(pixels, packed):
+    # (3,2,1,0): the first pixel sits in the lowest two bits.
+    assert frame_codec.pack_levels(np.array(pixels, dtype=np.uint8)) == packed
+
+def test_pack_rejects_partial_bytes():
+    with pytest.raises(ValueError):
+        frame_codec.pack_levels(np.zeros(6, dtype=np.uint8))
+
+@pytest.mark.parametrize(
+    "level, planes",
+    [
+        (3, (b"\x00", b"\x00")),  # white
+        (2, (b"\xff", b"\x00")),  # light gray
+        (1, (b"\x00", b"\xff")),  # dark gray
+        (0, (b"\xff", b"\xff")),  # black
+    ],
+)
+def test_firmware_remap(level, planes):
+    frame = frame_codec.pack_levels(np.full(8, level, dtype=np.uint8))
+    assert frame_codec.firmware_planes(frame) == planes
+
+def test_firmware_planes_match_display_loops(levels):
+    sample = frame_codec.pack_levels(levels)[:2000]
+    assert frame_codec.firmware_planes(sample) == _reference_firmware_planes(sample)
+
+def test_planes_round_trip(levels):
+    frame = frame_codec.pack_levels(levels)
+    assert np.array_equal(frame_codec.planes_to_levels(*frame_codec.firmware_planes(frame)), levels)
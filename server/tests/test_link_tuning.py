@@ -0,0 +1,83 @@
+import contextlib
+import io
+import json
+
+import numpy as np
+import pytest
+
+import link_tuning
+import metrics
+import send_image
+from link_tuning import MAX_WINDOW_ERRORS, MIN_ACK_TIMEOUT, MIN_CHUNK_SIZE, PROBE_CHUNKS, LinkTuner
+
+def _window(tuner, seconds_per_byte, rtt=0.01):
+    # One probe window of clean chunks at the current size.
+    size = tuner.chunk_size
+    for _ in range(PROBE_CHUNKS):
+        tuner.observe(size, size * seconds_per_byte, rtt, ok=True)
+
+@pytest.mark.parametrize("size, expected", [(257, 256), (10, MIN_CHUNK_SIZE), (4096, 1024)])
+def test_sizes_are_even_and_bounded(size, expected):
+    assert LinkTuner(size, 1024, 5.0).chunk_size == expected
+
+def test_grows_after_a_clean_window():
+    tuner = LinkTuner(256, 2048, 5.0)
+    _window(tuner, 1e-5)
+    assert tuner.chunk_size == 512
+
+def test_reverts_when_the_bigger_size_is_slower():
+    tuner = LinkTuner(256, 2048, 5.0)
+    _window(tuner, 1e-5)
+    assert tuner.chunk_size == 512
+    _window(tuner, 2e-5)
+    assert tuner.chunk_size == 256
+    # The slower size is not probed again during this upload.
+    _window(tuner, 1e-5)
+    assert tuner.chunk_size == 256
+
+def test_keeps_the_bigger_size_when_it_pays_off():
+    tuner = LinkTuner(256, 2048, 5.0)
+    _window(tuner, 2e-5)
+    _window(tuner, 1e-5)
+    assert tuner.chunk_size == 1024
+
+def test_halves_after_repeated_naks():
+    tuner = LinkTuner(1024, 2048, 5.0)
+    for _ in range(MAX_WINDOW_ERRORS - 1):
+        tuner.observe(1024, 0.01, 0.01, ok=False)
+    assert tuner.chunk_size == 1024
+    tuner.observe(1024, 0.01, 0.01, ok=False)
+    assert tuner.chunk_size == 512
+
+def test_stall_halves_and_caps_growth():
+    tuner = LinkTuner(1024, 2048, 5.0, srtt=0.1, rttvar=0.02)
+    tuner.stalled()
+    assert tuner.chunk_size == 512
+    # Scaled down with the size, then backed off.
+    assert tuner.srtt == pytest.approx(0.1)
+    _window(tuner, 1e-5)
+    _window(tuner, 1e-5)
+    assert tuner.chunk_size == 512
+
+def test_ack_timeout_is_clamped():
+    tuner = LinkTuner(256, 2048, 5.0)
+    assert tuner.ack_timeout == 5.0
+    tuner.observe(256, 0.001, 0.001, ok=True)
+    assert tuner.ack_timeout == MIN_ACK_TIMEOUT
+    for _ in range(PROBE_CHUNKS - 2):
+        tuner.observe(256, 30.0, 30.0, ok=True)
+    assert tuner.ack_timeout == 5.0
+
+def test_saved_size_above_the_panel_maximum(tmp_path):
+    # The panel reports a smaller max= than the size saved for its port.
+    port = "loop://?max_chunk=256&seed=1"
+    path = str(tmp_path / "link_tuning.json")
+    link_tuning.save(port, {"chunk_size": 1024, "srtt": 0.01, "rttvar": 0.005}, path)
+    raw = np.random.default_rng(0).integers(0, 256, send_image.EXPECTED_SIZE, dtype=np.uint8).tobytes()
+    cycle_metrics = metrics.CycleMetrics(port=port)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert send_image.send_frame(raw, port, cycle_metrics, tuning_path=path)
+    assert cycle_metrics.get("chunk_size") <= 256
+    assert cycle_metrics.get("chunk_retransmits") == 0
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)[port]["chunk_size"] <= 256
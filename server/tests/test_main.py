@@ -0,0 +1,8 @@
+from types import SimpleNamespace
+
+import main
+
+def test_push_to_removed_display_is_dropped(capsys):
+    runtime = SimpleNamespace(registry=[], states={}, superseded=None)
+    assert main._push(runtime, {"display": "desk", "message": "hi"}) == {"desk": "removed"}
+    assert "Dropped push for desk" in capsys.readouterr().out
@@ -0,0 +1,54 @@
+import binascii
+import zlib
+
+import pytest
+
+import pico_emulator
+import send_image
+import transport
+
+class _Link:
+    def __init__(self):
+        self.lines = []
+
+    def write(self, data):
+        self.lines.append(data.decode().strip())
+
+def _upload():
+    return pico_emulator._Upload("abcd1234", 0, "FULL")
+
+def _chunk(offset, data):
+    return "%d %08x %s" % (offset, zlib.crc32(data) & 0xFFFFFFFF, binascii.hexlify(data).decode())
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "x12 00000000 00ff",  # garbled offset
+        "0 zz000000 00ff",  # garbled checksum
+        "0 00000000 0g",  # garbled hex
+        "0 00000000",  # missing field
+    ],
+)
+def test_emulator_naks_malformed_chunks(line):
+    emulator = pico_emulator.PicoEmulator()
+    link = _Link()
+    upload = _upload()
+    assert emulator._receive_chunk(link, upload, line)
+    assert link.lines == ["NAK 0"]
+    assert upload.pos == 0
+
+def test_emulator_accepts_chunk_and_asks_for_resend():
+    emulator = pico_emulator.PicoEmulator()
+    link = _Link()
+    upload = _upload()
+    assert emulator._receive_chunk(link, upload, _chunk(0, b"\x01\x02"))
+    assert emulator._receive_chunk(link, upload, _chunk(0, b"\x03\x04"))
+    assert link.lines == ["OK 2", "RESEND 2"]
+
+def test_corrupted_ack_counts_as_no_reply():
+    host, device = transport.pipe_pair(timeout=1)
+    device.write(b"OK 1x2\n")
+    assert send_image._wait_ack(host, timeout=0.2) == (None, None, 0.2)
+    device.write(b"OK 512\n")
+    kind, value, _ = send_image._wait_ack(host, timeout=1)
+    assert (kind, value) == ("OK", 512)
@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+import render_worker
+
+pytestmark = pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="watchdog reads /proc")
+
+# Targets run in a spawned worker, so they live at module level.
+
+def _fill(conn, shm_name, value=7, ballast_mb=0):
+    ballast = bytearray(ballast_mb * 2**20)
+    ballast[::4096] = b"\x01" * len(ballast[::4096])
+    shm = shared_memory.SharedMemory(name=shm_name)
+    pixels = np.ndarray((render_worker.HEIGHT, render_worker.WIDTH), dtype=np.uint8, buffer=shm.buf)
+    try:
+        while conn.recv() is not None:
+            pixels[:] = value
+            conn.send(("ok", None))
+    finally:
+        del pixels
+        shm.close()
+
+def _render_ok(conn, shm_name):
+    _fill(conn, shm_name)
+
+def _render_big(conn, shm_name):
+    # Renders fine but stays large, like a worker Chromium has bloated.
+    _fill(conn, shm_name, ballast_mb=256)
+
+def _hang(conn, shm_name):
+    conn.recv()
+    time.sleep(600)
+
+def _bloat(conn, shm_name):
+    conn.recv()
+    ballast = bytearray(512 * 2**20)
+    ballast[::4096] = b"\x01" * len(ballast[::4096])
+    time.sleep(600)
+
+def _crash(conn, shm_name):
+    conn.recv()
+    sys.exit(1)
+
+@pytest.fixture
+def make_worker():
+    workers = []
+
+    def make(target, timeout=30, max_rss_mb=200):
+        worker = render_worker.RenderWorker(timeout=timeout, max_rss_mb=max_rss_mb, target=target)
+        workers.append(worker)
+        return worker
+
+    yield make
+    for worker in workers:
+        worker.close()
+
+def test_result_comes_back_through_shared_buffer(make_worker):
+    worker = make_worker(_render_ok)
+    pixels = worker.render()
+    assert pixels.shape == (render_worker.HEIGHT, render_worker.WIDTH)
+    assert np.all(pixels == 7)
+    worker.render()
+    assert worker.restarts == 0
+
+@pytest.mark.parametrize(
+    "target, kwargs, error",
+    [
+        (_hang, {"timeout": 1}, render_worker.RenderTimeout),
+        (_bloat, {"max_rss_mb": 200}, render_worker.RenderError),
+        (_crash, {}, render_worker.RenderError),
+    ],
+)
+def test_watchdog_kills_and_restarts(make_worker, target, kwargs, error):
+    worker = make_worker(target, **kwargs)
+    with pytest.raises(error):
+        worker.render()
+    assert worker._process is None
+    assert worker.restarts == 0
+
+    worker.target = _render_ok
+    assert np.all(worker.render() == 7)
+    assert worker.restarts == 1
+
+def test_oversized_worker_is_recycled_once(make_worker):
+    worker = make_worker(_render_big, max_rss_mb=200)
+    assert np.all(worker.render() == 7)
+    # The frame is kept, the worker is not.
+    assert worker._process is None
+    assert worker.peak_rss > 200 * 2**20
+
+    worker.target = _render_ok
+    worker.render()
+    assert worker.restarts == 1
@@ -0,0 +1,221 @@
+import contextlib
+import difflib
+import io
+import os
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import calendar_api
+import fonts
+import frame_codec
+import generate_image
+import send_image
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SNAPSHOT_DIR = os.path.join(SERVER_DIR, "snapshots")
+TEMPLATE_PATH = os.path.join(SERVER_DIR, "index.html")
+LOCAL_TZ = ZoneInfo("Asia/Seoul")
+FROZEN_NOW = datetime(2025, 3, 14, 9, 30, tzinfo=LOCAL_TZ)
+WEATHER_LABEL = "15시부터 비"
+# SNAPSHOT_UPDATE=1 rewrites the goldens instead of comparing against them.
+UPDATE = os.getenv("SNAPSHOT_UPDATE", "0") == "1"
+# Fraction of the 800x480 pixels allowed to differ from the golden frame;
+# covers font hinting and antialiasing drift between Chromium builds.
+PIXEL_TOLERANCE = float(os.getenv("SNAPSHOT_TOLERANCE", "0.002"))
+BUDGET_SCALE = float(os.getenv("SNAPSHOT_BUDGET_SCALE", "1.0"))
+STAGE_BUDGETS = {
+    "parse": 0.05,
+    "html": 0.05,
+    "fonts": 2.0,
+    "render": 15.0,
+    "crop": 0.5,
+    "pack": 0.5,
+}
+
+def _event(summary, hour, minute, minutes, day=0):
+    start = FROZEN_NOW.replace(hour=hour, minute=minute) + timedelta(days=day)
+    end = start + timedelta(minutes=minutes)
+    return {
+        "summary": summary,
+        "start": {"dateTime": start.isoformat()},
+        "end": {"dateTime": end.isoformat()},
+    }
+
+def _all_day(summary, day=0):
+    start = FROZEN_NOW.date() + timedelta(days=day)
+    return {
+        "summary": summary,
+        "start": {"date": start.isoformat()},
+        "end": {"date": (start + timedelta(days=1)).isoformat()},
+    }
+
+FIXTURES = {
+    "empty": [],
+    "typical": [
+        {"summary": "연차", "start": {"date": "2025-03-14"}, "end": {"date": "2025-03-15"}},
+        _event("팀 회의", 10, 0, 60),
+        _event("점심 약속 <Café>", 12, 30, 90),
+        _event("Code review", 16, 15, 45),
+        _event("운동", 19, 0, 60, day=1),
+        _event("Dentist", 11, 0, 30, day=2),
+    ],
+    # Early and late events widen the hour window past the 10-23 default.
+    "wide_window": [
+        _event("Early flight", 6, 40, 120),
+        _event("Overnight deploy", 22, 30, 90, day=1),
+        _event("Standup", 9, 0, 15, day=2),
+    ],
+    # 40 events over three days, including all-day ones and overlaps.
+    "busy": [
+        _event("Code review #0", 7, 45, 15, day=1),
+        _event("점심 약속 #1", 7, 45, 120, day=2),
+        _all_day("팀 회의 #2"),
+        _event("점심 약속 #3", 15, 45, 90, day=1),
+        _event("점심 약속 #4", 17, 0, 120),
+        _all_day("1:1 #5"),
+        _event("팀 회의 #6", 9, 0, 60),
+        _event("Code review #7", 16, 0, 60, day=1),
+        _event("Code review #8", 16, 0, 30, day=2),
+        _event("점심 약속 #9", 8, 0, 120, day=1),
+        _event("운동 #10", 15, 30, 90),
+        _event("Deploy #11", 14, 15, 60, day=1),
+        _event("운동 #12", 18, 0, 30, day=1),
+        _event("Dentist #13", 21, 0, 60),
+        _event("Deploy #14", 8, 0, 15, day=2),
+        _event("1:1 #15", 12, 15, 30, day=2),
+        _all_day("1:1 #16", day=1),
+        _event("점심 약속 #17", 16, 0, 60, day=2),
+        _event("스터디 #18", 16, 15, 90, day=1),
+        _event("점심 약속 #19", 14, 30, 15),
+        _event("Dentist #20", 17, 45, 90),
+        _event("1:1 #21", 12, 30, 15, day=1),
+        _event("스터디 #22", 8, 45, 90, day=1),
+        _event("운동 #23", 9, 0, 30),
+        _event("1:1 #24", 14, 45, 15, day=1),
+        _event("Deploy #25", 11, 15, 30),
+        _event("Dentist #26", 12, 30, 90, day=1),
+        _all_day("Code review #27"),
+        _event("운동 #28", 7, 0, 90),
+        _event("Code review #29", 7, 0, 30, day=2),
+        _event("스터디 #30", 12, 0, 30, day=1),
+        _event("팀 회의 #31", 20, 45, 120, day=2),
+        _event("1:1 #32", 8, 30, 90, day=1),
+        _all_day("1:1 #33", day=2),
+        _event("운동 #34", 8, 45, 60),
+        _event("팀 회의 #35", 16, 0, 30, day=2),
+        _event("점심 약속 #36", 16, 45, 15, day=2),
+        _event("운동 #37", 9, 15, 60),
+        _event("스터디 #38", 8, 45, 90, day=1),
+        _event("Deploy #39", 8, 15, 30, day=1),
+    ],
+}
+
+def _timed(timings, name, func):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+    return wrapper
+
+@pytest.fixture
+def frozen_weather(monkeypatch):
+    monkeypatch.setattr(generate_image, "fetch_weather_label", lambda day_date, local_tz: WEATHER_LABEL)
+
+def render_frame(items, image_path, monkeypatch):
+    # Fixed events, frozen clock and a fixed weather label through
+    # create_time_image to the packed frame. Returns (frame, stage timings).
+    timings = {}
+    for module, name, stage in (
+        (generate_image, "build_html", "html"),
+        (fonts, "inline_fonts", "fonts"),
+        (generate_image, "render_html", "render"),
+        (generate_image, "crop_screenshot", "crop"),
+    ):
+        monkeypatch.setattr(module, name, _timed(timings, stage, getattr(module, name)))
+    events = _timed(timings, "parse", calendar_api.parse_events)(items, LOCAL_TZ)
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate_image.create_time_image(
+            image_name=image_path, events=events, template_path=TEMPLATE_PATH, now=FROZEN_NOW
+        )
+    frame = _timed(timings, "pack", send_image.process_image)(image_path)
+    return frame, timings
+
+def _load_levels(path):
+    with Image.open(path) as img:
+        grays = np.asarray(img.convert("L"))
+    return np.searchsorted(frame_codec.LEVEL_GRAYS, grays).astype(np.uint8)
+
+def compare_frame(frame, golden_path, diff_path=None):
+    # Fraction of pixels whose gray level differs from the golden PNG.
+    actual = frame_codec.unpack_levels(frame)
+    expected = _load_levels(golden_path)
+    changed = actual != expected
+    if diff_path and changed.any():
+        diff = np.where(changed, 0, 255).astype(np.uint8)
+        Image.fromarray(diff, mode="L").save(diff_path)
+    return np.count_nonzero(changed) / changed.size
+
+@pytest.mark.parametrize("name", sorted(FIXTURES))
+def test_html_matches_golden(name, frozen_weather):
+    events = calendar_api.parse_events(FIXTURES[name], LOCAL_TZ)
+    html_content = generate_image.build_html(events, now=FROZEN_NOW, template_path=TEMPLATE_PATH)
+    golden = os.path.join(SNAPSHOT_DIR, f"{name}.html")
+    if UPDATE:
+        with open(golden, "w", encoding="utf-8") as f:
+            f.write(html_content)
+        return
+    with open(golden, "r", encoding="utf-8") as f:
+        expected_html = f.read()
+    diff = difflib.unified_diff(
+        expected_html.splitlines(), html_content.splitlines(), "golden", "actual", lineterm="", n=1
+    )
+    assert html_content == expected_html, "\n".join(list(diff)[:40])
+
+@pytest.mark.parametrize("name", sorted(FIXTURES))
+def test_frame_matches_golden(name, frozen_weather, chromium, monkeypatch, tmp_path):
+    frame, timings = render_frame(FIXTURES[name], str(tmp_path / f"{name}.png"), monkeypatch)
+    assert len(frame) == frame_codec.FRAME_SIZE
+    golden = os.path.join(SNAPSHOT_DIR, f"{name}.png")
+    if UPDATE:
+        frame_codec.frame_to_png(frame, golden)
+    else:
+        assert os.path.exists(golden), f"missing golden {golden}; run with SNAPSHOT_UPDATE=1"
+        diff_path = str(tmp_path / f"{name}.diff.png")
+        changed = compare_frame(frame, golden, diff_path)
+        assert changed <= PIXEL_TOLERANCE, (
+            f"frame differs from golden by {changed:.4%} "
+            f"(tolerance {PIXEL_TOLERANCE:.4%}); diff mask at {diff_path}"
+        )
+    over = {
+        stage: seconds
+        for stage, seconds in timings.items()
+        if seconds > STAGE_BUDGETS[stage] * BUDGET_SCALE
+    }
+    assert not over, f"stages over budget: {over}"
+
+def test_compare_frame_tolerance(tmp_path):
+    rng = np.random.default_rng(0)
+    levels = rng.integers(0, 4, size=(frame_codec.HEIGHT, frame_codec.WIDTH), dtype=np.uint8)
+    golden = str(tmp_path / "golden.png")
+    frame_codec.levels_to_image(levels).save(golden, format="PNG")
+    assert compare_frame(frame_codec.pack_levels(levels), golden) == 0.0
+
+    # Flip just under and just over the tolerance worth of pixels.
+    allowed = int(PIXEL_TOLERANCE * levels.size)
+    for flipped, within in ((allowed - 1, True), (allowed + 1, False)):
+        drifted = levels.copy().reshape(-1)
+        drifted[:flipped] ^= 3
+        diff_path = str(tmp_path / f"diff_{flipped}.png")
+        changed = compare_frame(frame_codec.pack_levels(drifted.reshape(levels.shape)), golden, diff_path)
+        assert changed == pytest.approx(flipped / levels.size)
+        assert bool(changed <= PIXEL_TOLERANCE) == within
+        with Image.open(diff_path) as mask:
+            assert np.count_nonzero(np.asarray(mask) == 0) == flipped
@@ -0,0 +1,20 @@
+import pytest
+
+import transport
+
+def test_incomplete_transport_fails_on_creation():
+    class ReadOnly(transport._BufferedTransport):
+        def _fill(self, timeout):
+            return False
+
+    with pytest.raises(TypeError):
+        ReadOnly()
+
+def test_pipe_pair_round_trip():
+    host, device = transport.pipe_pair(timeout=1)
+    host.write(b"CAN_SEND\n")
+    assert device.readline() == b"CAN_SEND\n"
+    device.write(b"YES\npartial")
+    assert host.readline() == b"YES\n"
+    assert host.in_waiting == len(b"partial")
+    host.close()
@@ -0,0 +1,171 @@
+import abc
+import socket
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+# Transports expose the subset of the pyserial API used by send_image:
+# write, flush, in_waiting, readline, reset_*_buffer and close.
+
+class _BufferedTransport(abc.ABC):
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._rx = bytearray()
+        self._closed = False
+
+    @abc.abstractmethod
+    def _fill(self, timeout):
+        # Move whatever arrives within timeout seconds into self._rx.
+        ...
+
+    @abc.abstractmethod
+    def write(self, data):
+        ...
+
+    def flush(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        if not self._closed:
+            self._fill(0)
+        return len(self._rx)
+
+    def readline(self):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            newline = self._rx.find(b"\n")
+            if newline >= 0:
+                line = bytes(self._rx[: newline + 1])
+                del self._rx[: newline + 1]
+                return line
+            if self._closed:
+                break
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+            self._fill(remaining)
+        line = bytes(self._rx)
+        self._rx.clear()
+        return line
+
+    def reset_input_buffer(self):
+        if not self._closed:
+            self._fill(0)
+        self._rx.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        self._closed = True
+
+class SocketTransport(_BufferedTransport):
+    def __init__(self, host=None, port=None, timeout=None, sock=None):
+        super().__init__(timeout)
+        if sock is None:
+            sock = socket.create_connection((host, port), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+
+    def _fill(self, timeout):
+        self._sock.settimeout(timeout)
+        try:
+            data = self._sock.recv(65536)
+        except (BlockingIOError, socket.timeout):
+            return False
+        if not data:
+            self._closed = True
+            return False
+        self._rx.extend(data)
+        return True
+
+    def write(self, data):
+        self._sock.sendall(data)
+        return len(data)
+
+    def close(self):
+        super().close()
+        self._sock.close()
+
+class _Channel:
+    def __init__(self):
+        self.data = bytearray()
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def put(self, data):
+        with self.cond:
+            if self.closed:
+                raise BrokenPipeError("pipe closed")
+            self.data.extend(data)
+            self.cond.notify_all()
+
+    def take(self, timeout):
+        with self.cond:
+            if not self.data and not self.closed and timeout != 0:
+                self.cond.wait(timeout)
+            data = bytes(self.data)
+            self.data.clear()
+            return data, self.closed
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+class PipeTransport(_BufferedTransport):
+    def __init__(self, rx_channel, tx_channel, timeout=None):
+        super().__init__(timeout)
+        self._rx_channel = rx_channel
+        self._tx_channel = tx_channel
+
+    def _fill(self, timeout):
+        data, closed = self._rx_channel.take(timeout)
+        self._rx.extend(data)
+        if closed and not data:
+            self._closed = True
+        return bool(data)
+
+    def write(self, data):
+        self._tx_channel.put(data)
+        return len(data)
+
+    def close(self):
+        super().close()
+        self._rx_channel.close()
+        self._tx_channel.close()
+
+def pipe_pair(timeout=None):
+    host_to_device = _Channel()
+    device_to_host = _Channel()
+    host = PipeTransport(device_to_host, host_to_device, timeout)
+    device = PipeTransport(host_to_device, device_to_host)
+    return host, device
+
+def _start_loopback(query, timeout):
+    import pico_emulator
+
+    options = {key: values[-1] for key, values in parse_qs(query).items()}
+    emulator = pico_emulator.PicoEmulator.from_options(options)
+    host, device = pipe_pair(timeout)
+    thread = threading.Thread(target=emulator.run, args=(device,), daemon=True)
+    thread.start()
+    host.emulator = emulator
+    return host
+
+def open_transport(url, baudrate=115200, timeout=None):
+    # "tcp://host:port" connects to a networked device or emulator,
+    # "loop://?latency=0.01&error_rate=0.05" starts an in-process emulator,
+    # anything else is treated as a serial device path.
+    parts = urlsplit(url)
+    if parts.scheme == "tcp":
+        return SocketTransport(parts.hostname, parts.port, timeout)
+    if parts.scheme == "loop":
+        return _start_loopback(parts.query, timeout)
+
+    import serial
+
+    return serial.Serial(url, baudrate, timeout=timeout)